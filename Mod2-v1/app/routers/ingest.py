@@ -1,5 +1,6 @@
 from __future__ import annotations
-from typing import Optional, Dict, Any
+import json
+from typing import Optional, Dict, Any, List
 from fastapi import APIRouter, Request, Header, HTTPException, status
 
 # ВАЛИДАЦИЯ по JSON-схемам
@@ -9,7 +10,7 @@ from app.utils.schemas import chunk_validator, final_validator
 from app.utils.security import verify_hmac_sha256
 
 from config.settings import settings  # type: ignore
-from app.services.ingest_service import process_chunk, process_final
+from app.services.ingest_service import process_chunk, process_final, process_chunks_batch
 from app.services.idempotency import seen_before
 from app.services.webhooks import upsert_webhook, get_secret_for_session
 from app.services.tracing import log_event 
@@ -17,6 +18,12 @@ from app.services.tracing import log_event
 router = APIRouter(prefix="/v2")
 
 
+async def secret_for_session(sid: Optional[str]) -> str:
+    """Секрет подписи: из таблицы webhooks по session_id, если есть, иначе — settings.ingest_secret."""
+    per_session_secret = await get_secret_for_session(sid) if sid else None
+    return per_session_secret or settings.ingest_secret
+
+
 @router.post("/webhooks/register")
 async def register_webhook(payload: Dict[str, Any]):
     """
@@ -63,8 +70,7 @@ async def ingest_chunk(
         raise HTTPException(status_code=400, detail="Invalid JSON")
 
     sid = data.get("session_id") if isinstance(data, dict) else None
-    per_session_secret = await get_secret_for_session(sid) if sid else None
-    use_secret = per_session_secret or settings.ingest_secret
+    use_secret = await secret_for_session(sid)
 
     # Временно отключаем проверку подписи для отладки
     # if not verify_hmac_sha256(use_secret, raw, x_signature):
@@ -102,6 +108,99 @@ async def ingest_chunk(
     return {"status": "ok"}
 
 
+def parse_chunk_batch(raw: bytes, content_type: str) -> List[Any]:
+    """
+    Разбирает тело пачки: NDJSON (по объекту на строку),
+    JSON-массив или объект вида {"chunks": [...]}.
+    """
+    if "ndjson" in content_type or "jsonl" in content_type:
+        return [json.loads(line) for line in raw.decode("utf-8").splitlines() if line.strip()]
+    data = json.loads(raw)
+    if isinstance(data, dict):
+        data = data.get("chunks")
+    if not isinstance(data, list):
+        raise ValueError("expected a list of chunks")
+    return data
+
+
+@router.post("/ingest/chunks:batch")
+async def ingest_chunks_batch(
+    request: Request,
+    x_signature: Optional[str] = Header(default=None, alias="X-Signature"),
+    x_request_id: Optional[str] = Header(default=None, alias="X-Request-Id"),
+):
+    """
+    Приём пачки чанков. Каждый элемент валидируется по contracts/chunk.json
+    отдельно; идемпотентность — по ключу "<session_id>:<chunk_id>" на элемент.
+    Все новые элементы пишутся в ingest_events одной транзакцией.
+    Ответ содержит результат по каждому элементу в исходном порядке:
+    ok | idempotent | invalid.
+    Пачка относится к одной session_id; подпись проверяется её секретом,
+    как в /ingest/chunk.
+    """
+    raw = await request.body()
+    try:
+        items = parse_chunk_batch(raw, request.headers.get("content-type", ""))
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+
+    if len(items) > settings.ingest_batch_max:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"batch is limited to {settings.ingest_batch_max} chunks",
+        )
+
+    sids = {it.get("session_id") for it in items if isinstance(it, dict)}
+    if len(sids) > 1:
+        raise HTTPException(status_code=400, detail="batch must contain chunks of one session_id")
+    sid = next(iter(sids), None)
+    if not verify_hmac_sha256(await secret_for_session(sid if isinstance(sid, str) else None), raw, x_signature):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Bad signature")
+
+    results: List[Dict[str, Any]] = []
+    valid: List[Dict[str, Any]] = []
+    valid_idx: List[int] = []
+    for i, item in enumerate(items):
+        errors = sorted(e.message for e in chunk_validator.iter_errors(item))
+        results.append({
+            "index": i,
+            "chunk_id": item.get("chunk_id") if isinstance(item, dict) else None,
+            "seq": item.get("seq") if isinstance(item, dict) else None,
+            "status": "invalid" if errors else "ok",
+        })
+        if errors:
+            results[-1]["schema_errors"] = errors
+        else:
+            valid.append(item)
+            valid_idx.append(i)
+
+    if valid:
+        keys = [f"{it['session_id']}:{it['chunk_id']}" for it in valid]
+        idempotent = await process_chunks_batch(valid, keys)
+        for i, dup in zip(valid_idx, idempotent):
+            if dup:
+                results[i]["status"] = "idempotent"
+
+    log_event(
+        "chunk_batch_received",
+        service="module2",
+        session_id=valid[0]["session_id"] if valid else None,
+        seq=None,
+        status="ok",
+        request_id=x_request_id,
+        items=len(items),
+        invalid=len(items) - len(valid),
+    )
+
+    return {
+        "status": "ok",
+        "accepted": sum(1 for r in results if r["status"] == "ok"),
+        "idempotent": sum(1 for r in results if r["status"] == "idempotent"),
+        "invalid": sum(1 for r in results if r["status"] == "invalid"),
+        "results": results,
+    }
+
+
 @router.post("/ingest/full")
 async def ingest_full(
     request: Request,
@@ -121,8 +220,7 @@ async def ingest_full(
         raise HTTPException(status_code=400, detail="Invalid JSON")
 
     sid = data.get("session_id") if isinstance(data, dict) else None
-    per_session_secret = await get_secret_for_session(sid) if sid else None
-    use_secret = per_session_secret or settings.ingest_secret
+    use_secret = await secret_for_session(sid)
 
     # Временно отключаем проверку подписи для отладки
     # if not verify_hmac_sha256(use_secret, raw, x_signature):
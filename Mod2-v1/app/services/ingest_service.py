@@ -1,7 +1,7 @@
 import time
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from app.services.tracing import log_event
-from app.services.store import save_chunk, save_final
+from app.services.store import save_chunk, save_final, save_chunks_batch
 from app.services.mapping import process_text_mapping
 
 async def process_chunk(data: Dict[str, Any], idem_key: Optional[str]):
@@ -28,6 +28,39 @@ async def process_chunk(data: Dict[str, Any], idem_key: Optional[str]):
     
     log_event("chunk_ingested", session_id=data["session_id"], seq=data["seq"], latency_ms=int((time.time()-t0)*1000))
 
+async def process_chunks_batch(items: List[Dict[str, Any]], idem_keys: List[str]) -> List[bool]:
+    """
+    Сохраняет пачку чанков одной транзакцией и прогоняет NLP только по новым.
+    Возвращает для каждого элемента признак "уже был принят ранее".
+    """
+    t0 = time.time()
+    inserted = await save_chunks_batch(items, idem_keys)
+
+    idempotent: List[bool] = []
+    for data, key in zip(items, idem_keys):
+        if key not in inserted:
+            idempotent.append(True)
+            continue
+        # ключ обрабатываем один раз, даже если он повторился внутри пачки
+        inserted.discard(key)
+        idempotent.append(False)
+        text = data.get("text", "")
+        mappings = process_text_mapping(text)
+        log_event("chunk_processed",
+                  session_id=data["session_id"],
+                  seq=data["seq"],
+                  text_length=len(text),
+                  mappings_count=len(mappings),
+                  latency_ms=int((time.time()-t0)*1000))
+
+    log_event("chunks_batch_ingested",
+              session_id=items[0]["session_id"] if items else None,
+              seq=None,
+              items=len(items),
+              accepted=idempotent.count(False),
+              latency_ms=int((time.time()-t0)*1000))
+    return idempotent
+
 async def process_final(data: Dict[str, Any], idem_key: Optional[str]):
     t0 = time.time()
     
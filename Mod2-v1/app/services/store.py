@@ -2,7 +2,7 @@ from sqlalchemy import select
 from app.db import async_session
 from app.models import IngestEvent
 from sqlalchemy.exc import IntegrityError
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Set
 
 async def save_chunk(data, idem_key):
     async with async_session() as s:
@@ -34,6 +34,47 @@ async def save_final(data, idem_key):
         except IntegrityError:
             await s.rollback()
 
+def _chunk_event(data: Dict[str, Any], idem_key: str) -> IngestEvent:
+    return IngestEvent(
+        idempotency_key=idem_key,
+        session_id=data["session_id"],
+        kind="chunk",
+        payload=data,
+        seq=data["seq"],
+    )
+
+async def save_chunks_batch(items: List[Dict[str, Any]], idem_keys: List[str]) -> Set[str]:
+    """
+    Сохраняет пачку чанков одной транзакцией.
+    Возвращает ключи, которые были вставлены; остальные уже встречались (идемпотентность).
+    """
+    async with async_session() as s:
+        res = await s.execute(
+            select(IngestEvent.idempotency_key).where(IngestEvent.idempotency_key.in_(set(idem_keys)))
+        )
+        seen: Set[str] = set(res.scalars().all())
+        fresh: Dict[str, Dict[str, Any]] = {}
+        for data, key in zip(items, idem_keys):
+            if key not in seen:
+                fresh.setdefault(key, data)
+        s.add_all([_chunk_event(data, key) for key, data in fresh.items()])
+        try:
+            await s.commit()
+            return set(fresh)
+        except IntegrityError:
+            await s.rollback()
+
+        # те же ключи успел вставить параллельный запрос — добиваем построчно
+        inserted: Set[str] = set()
+        for key, data in fresh.items():
+            s.add(_chunk_event(data, key))
+            try:
+                await s.commit()
+                inserted.add(key)
+            except IntegrityError:
+                await s.rollback()
+        return inserted
+
 def get_session_results(session_id: str) -> List[Dict[str, Any]]:
     """
     Синхронная функция для получения результатов сессии.
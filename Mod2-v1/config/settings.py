@@ -76,6 +76,9 @@ class Settings(BaseSettings):
     
     # — Security —
     ingest_secret: str = Field(default="changeme", alias="INGEST_SECRET")
+
+    # — Ingest —
+    ingest_batch_max: int = Field(default=500, alias="INGEST_BATCH_MAX")
     
     # — Server —
     environment: str = Field(default="dev")
@@ -0,0 +1,67 @@
+import hashlib
+import hmac
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from config.settings import settings
+from app.routers import ingest
+from app.routers.ingest import parse_chunk_batch
+
+# только роутер ingest: проверки до обработки не тянут NLP-зависимости
+light_app = FastAPI()
+light_app.include_router(ingest.router)
+
+
+def _chunk(seq, text="Нужна форма обратной связи", sid="batch1"):
+    return {"session_id": sid, "chunk_id": f"c{seq}", "seq": seq, "text": text, "lang": "ru-RU"}
+
+
+def _signed(items):
+    body = json.dumps(items, ensure_ascii=False).encode("utf-8")
+    sig = hmac.new(settings.ingest_secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return body, {"Content-Type": "application/json", "X-Signature": f"sha256={sig}"}
+
+
+def test_parse_chunk_batch_formats():
+    items = [_chunk(1), _chunk(2)]
+    assert parse_chunk_batch(json.dumps(items).encode(), "application/json") == items
+    assert parse_chunk_batch(json.dumps({"chunks": items}).encode(), "application/json") == items
+    ndjson = "\n".join(json.dumps(it) for it in items) + "\n"
+    assert parse_chunk_batch(ndjson.encode(), "application/x-ndjson") == items
+
+
+def test_batch_requires_signature():
+    c = TestClient(light_app)
+    r = c.post("/v2/ingest/chunks:batch", json=[_chunk(1)])
+    assert r.status_code == 401
+    body, headers = _signed([_chunk(1)])
+    headers["X-Signature"] = "sha256=" + "0" * 64
+    assert c.post("/v2/ingest/chunks:batch", content=body, headers=headers).status_code == 401
+
+
+def test_batch_rejects_mixed_sessions():
+    body, headers = _signed([_chunk(1), _chunk(2, sid="other")])
+    r = TestClient(light_app).post("/v2/ingest/chunks:batch", content=body, headers=headers)
+    assert r.status_code == 400
+
+
+def test_batch_reports_per_item_results():
+    pytest.importorskip("stanza")
+    from main import app
+
+    with TestClient(app) as c:
+        items = [_chunk(1), {"session_id": "batch1", "seq": 2}, _chunk(1)]
+        body, headers = _signed(items)
+        r = c.post("/v2/ingest/chunks:batch", content=body, headers=headers)
+        assert r.status_code == 200
+        statuses = [it["status"] for it in r.json()["results"]]
+        assert statuses[1] == "invalid"
+        # один и тот же chunk_id внутри пачки принимается один раз
+        assert statuses[2] == "idempotent"
+
+        body, headers = _signed([_chunk(1)])
+        r2 = c.post("/v2/ingest/chunks:batch", content=body, headers=headers)
+        assert r2.json()["results"][0]["status"] == "idempotent"
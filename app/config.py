@@ -16,11 +16,33 @@ class WhisperCfg(BaseSettings):
     vad_filter: bool = True
     temperature: float = 0.0
 
+class AsrCfg(BaseSettings):
+    pool_size: int = int(os.getenv("ASR_POOL_SIZE", "1"))
+    pool_timeout_sec: float = float(os.getenv("ASR_POOL_TIMEOUT_SEC", "300"))
+    warmup: bool = os.getenv("ASR_WARMUP", "true").lower() == "true"
+    workers: int = int(os.getenv("ASR_WORKERS", os.getenv("ASR_POOL_SIZE", "1")))
+    queue_max: int = int(os.getenv("ASR_QUEUE_MAX", "8"))
+    retry_after_sec: int = int(os.getenv("ASR_RETRY_AFTER_SEC", "5"))
+    streaming: bool = os.getenv("ASR_STREAMING", "true").lower() == "true"
+    stream_holdback_sec: float = float(os.getenv("ASR_STREAM_HOLDBACK_SEC", "1.5"))
+    stream_max_window_sec: float = float(os.getenv("ASR_STREAM_MAX_WINDOW_SEC", "25"))
+    stream_prompt_chars: int = int(os.getenv("ASR_STREAM_PROMPT_CHARS", "200"))
+    stream_buffer_sec: float = float(os.getenv("ASR_STREAM_BUFFER_SEC", "60"))
+    ffmpeg_bin: str = os.getenv("FFMPEG_BIN", "ffmpeg")
+    long_file_min_sec: float = float(os.getenv("ASR_LONG_FILE_MIN_SEC", "600"))
+    long_segment_sec: float = float(os.getenv("ASR_LONG_SEGMENT_SEC", "120"))
+    long_min_silence_ms: int = int(os.getenv("ASR_LONG_MIN_SILENCE_MS", "700"))
+    cache_mem_items: int = int(os.getenv("ASR_CACHE_MEM_ITEMS", "256"))
+    cache_dir: str = os.getenv("ASR_CACHE_DIR", "./data/asr_cache")
+    cache_disk_mb: int = int(os.getenv("ASR_CACHE_DISK_MB", "512"))
+
 class ChunkingCfg(BaseSettings):
     sent_min: int = Field(default=int(os.getenv("CHUNK_SENT_MIN", 3)))
     sent_max: int = Field(default=int(os.getenv("CHUNK_SENT_MAX", 5)))
     char_limit: int = Field(default=int(os.getenv("CHUNK_CHAR_LIMIT", 1200)))
     overlap_sent: int = Field(default=int(os.getenv("OVERLAP_SENT", 1)))
+    # live: незавершённое предложение длиннее — режется по пробелу (речь без пунктуации)
+    sentence_max_chars: int = Field(default=int(os.getenv("CHUNK_SENTENCE_MAX_CHARS", 600)))
 
 class AppCfg(BaseSettings):
     host: str = "0.0.0.0"
@@ -32,11 +54,39 @@ class AppCfg(BaseSettings):
     tier: Literal['Basic','Extended','Premium'] = os.getenv("TIER", "Basic")
     stub_asr: bool = os.getenv("STUB_ASR", "false").lower() == "true"
     ws_debounce_ms: int = int(os.getenv("WS_DEBOUNCE_MS", "1200"))
+    # протокол 2 /v1/stream: ack раз в N кадров или T мс, сигналы slow_down/resume
+    ws_ack_frames: int = int(os.getenv("WS_ACK_FRAMES", "25"))
+    ws_ack_ms: int = int(os.getenv("WS_ACK_MS", "1000"))
+    ws_slow_down_load: float = float(os.getenv("WS_SLOW_DOWN_LOAD", "0.8"))
+    ws_resume_load: float = float(os.getenv("WS_RESUME_LOAD", "0.5"))
+    # как часто сбрасывать в БД счётчики received_bytes; при падении
+    # процесса теряются только байты, принятые за последний интервал
+    bytes_flush_ms: int = int(os.getenv("BYTES_FLUSH_MS", "2000"))
+    # границы памяти live-сессий
+    max_live_sessions: int = int(os.getenv("MAX_LIVE_SESSIONS", "200"))
+    live_idle_timeout_sec: float = float(os.getenv("LIVE_IDLE_TIMEOUT_SEC", "300"))
+    live_max_age_sec: float = float(os.getenv("LIVE_MAX_AGE_SEC", "14400"))
+    closed_retention_sec: float = float(os.getenv("CLOSED_RETENTION_SEC", "120"))
+    max_closed_sessions: int = int(os.getenv("MAX_CLOSED_SESSIONS", "500"))
+    session_sweep_sec: float = float(os.getenv("SESSION_SWEEP_SEC", "10"))
+    # шардирование live-сессий между воркерами (см. services/affinity.py)
+    affinity_enabled: bool = os.getenv("AFFINITY_ENABLED", "false").lower() == "true"
+    node_id: str = os.getenv("NODE_ID", "")      # пусто — hostname:pid
+    node_url: str = os.getenv("NODE_URL", "")    # адрес этого воркера для redirect, напр. ws://mod1-2:8080
+    coord_store: str = os.getenv("COORD_STORE", "db")  # db | local
+    node_ttl_sec: float = float(os.getenv("NODE_TTL_SEC", "15"))
+    ring_vnodes: int = int(os.getenv("RING_VNODES", "64"))
 
 class Settings(BaseSettings):
     db_url: str = os.getenv("DB_URL", "sqlite:///./data/asr.db")
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    db_max_overflow: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    db_pool_timeout_sec: float = float(os.getenv("DB_POOL_TIMEOUT_SEC", "30"))
+    db_pool_recycle_sec: int = int(os.getenv("DB_POOL_RECYCLE_SEC", "1800"))
+    sqlite_busy_timeout_ms: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
     app: AppCfg = AppCfg()
     whisper: WhisperCfg = WhisperCfg()
+    asr: AsrCfg = AsrCfg()
     chunking: ChunkingCfg = ChunkingCfg()
     limits: dict[str, LimitCfg] = {
         "Basic": LimitCfg(),
@@ -56,6 +106,9 @@ class Settings(BaseSettings):
             if 'whisper' in data:
                 for k, v in data['whisper'].items():
                     setattr(s.whisper, k, v)
+            if 'asr' in data:
+                for k, v in data['asr'].items():
+                    setattr(s.asr, k, v)
             if 'chunking' in data:
                 for k, v in data['chunking'].items():
                     setattr(s.chunking, k, v)
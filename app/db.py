@@ -1,11 +1,118 @@
 from __future__ import annotations
+from typing import Any, Dict
+from sqlalchemy import event, inspect, text
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from .config import settings
 
+
+def _async_db_url(url: str) -> str:
+    """sqlite → aiosqlite, postgres → asyncpg; явно заданный драйвер не трогаем."""
+    if url.startswith("sqlite+") or "+asyncpg" in url:
+        return url
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    for prefix in ("postgresql+psycopg2:", "postgresql:", "postgres:"):
+        if url.startswith(prefix):
+            return url.replace(prefix, "postgresql+asyncpg:", 1)
+    return url
+
+
+def _pool_kwargs(url: str) -> Dict[str, Any]:
+    if ":memory:" in url:
+        return {}
+    kw: Dict[str, Any] = {}
+    if url.startswith("sqlite"):
+        # aiosqlite по умолчанию открывает соединение на каждый запрос (NullPool)
+        kw["poolclass"] = AsyncAdaptedQueuePool
+    return {
+        **kw,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout_sec,
+        "pool_recycle": settings.db_pool_recycle_sec,
+        "pool_pre_ping": not url.startswith("sqlite"),
+    }
+
+
+def _sqlite_pragmas(dbapi_conn: Any, _record: Any) -> None:
+    # WAL: читатели не блокируют писателя; busy_timeout вместо мгновенного "database is locked"
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.close()
+
+
+ASYNC_DB_URL = _async_db_url(settings.db_url)
+
+# синхронный движок остаётся для create_all и служебных скриптов
 engine = create_engine(settings.db_url, echo=False)
+async_engine = create_async_engine(ASYNC_DB_URL, echo=False, **_pool_kwargs(ASYNC_DB_URL))
+async_session = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+if settings.db_url.startswith("sqlite"):
+    event.listen(engine, "connect", _sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
+
+def _add_missing_columns() -> None:
+    """Миграций нет: новые nullable-колонки моделей добавляем в старые таблицы."""
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in existing or not col.nullable:
+                    continue
+                ddl = col.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {col.name} {ddl}'))
+
+def _dedupe_chunks() -> None:
+    """Перед уникальным индексом (session_id, seq) убираем дубли от старых ретраев.
+
+    Оставляем самую свежую строку — так же, как сделал бы upsert.
+    """
+    if "ux_chunks_session_seq" in {i["name"] for i in inspect(engine).get_indexes("chunks")}:
+        return
+    with engine.begin() as conn:
+        conn.execute(text(
+            "DELETE FROM chunks WHERE EXISTS (SELECT 1 FROM chunks c2"
+            " WHERE c2.session_id = chunks.session_id AND c2.seq = chunks.seq"
+            " AND (c2.created_at > chunks.created_at"
+            " OR (c2.created_at = chunks.created_at AND c2.id > chunks.id)))"
+        ))
+        # неуникальный индекс прежних версий покрывается новым
+        conn.execute(text("DROP INDEX IF EXISTS ix_chunks_session_seq"))
+
+def _dedupe_transcripts() -> None:
+    """Перед уникальным индексом по session_id оставляем последний транскрипт сессии."""
+    if "ux_transcripts_session" in {i["name"] for i in inspect(engine).get_indexes("transcripts")}:
+        return
+    with engine.begin() as conn:
+        conn.execute(text(
+            "DELETE FROM transcripts WHERE EXISTS (SELECT 1 FROM transcripts t2"
+            " WHERE t2.session_id = transcripts.session_id"
+            " AND (t2.created_at > transcripts.created_at"
+            " OR (t2.created_at = transcripts.created_at AND t2.id > transcripts.id)))"
+        ))
+        conn.execute(text("DROP INDEX IF EXISTS ix_transcripts_session_id"))
 
 def init_db() -> None:
     SQLModel.metadata.create_all(engine)
+    _add_missing_columns()
+    _dedupe_chunks()
+    _dedupe_transcripts()
+    # create_all не добавляет индексы в уже существующие таблицы
+    for name in ("chunks", "transcripts"):
+        for index in SQLModel.metadata.tables[name].indexes:
+            index.create(engine, checkfirst=True)
 
 def get_session() -> Session:
-    return Session(engine)
\ No newline at end of file
+    return Session(engine)
+
+def get_async_session() -> AsyncSession:
+    return async_session()
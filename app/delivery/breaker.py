@@ -0,0 +1,133 @@
+from __future__ import annotations
+import os, time, asyncio
+from typing import Any, Dict
+
+FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURES", "5"))
+OPEN_SEC = float(os.getenv("BREAKER_OPEN_SEC", "30"))
+HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+AIMD_INITIAL = float(os.getenv("AIMD_INITIAL", "4"))
+AIMD_MIN = float(os.getenv("AIMD_MIN", "1"))
+AIMD_MAX = float(os.getenv("AIMD_MAX", os.getenv("DELIVERY_PER_HOST_CONNECTIONS", "10")))
+AIMD_DECREASE = float(os.getenv("AIMD_DECREASE", "0.5"))
+AIMD_LATENCY_TARGET_MS = float(os.getenv("AIMD_LATENCY_TARGET_MS", "2000"))
+AIMD_COOLDOWN_SEC = float(os.getenv("AIMD_COOLDOWN_SEC", "1"))
+
+
+class CircuitOpen(Exception):
+    """Цель недоступна — запрос не отправлялся, повторить не раньше retry_after."""
+
+    def __init__(self, url: str, retry_after: float) -> None:
+        super().__init__(f"circuit open for {url}")
+        self.url = url
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """closed → (FAILURE_THRESHOLD ошибок подряд) → open → (OPEN_SEC) → half_open.
+
+    В half_open пропускается не больше HALF_OPEN_PROBES пробных запросов:
+    успех закрывает цепь, ошибка снова открывает её.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.opened_total = 0
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < OPEN_SEC:
+                return False
+            self.state = self.HALF_OPEN
+            self.probes = 0
+        if self.state == self.HALF_OPEN:
+            if self.probes >= HALF_OPEN_PROBES:
+                return False
+            self.probes += 1
+        return True
+
+    def retry_after(self) -> float:
+        if self.state == self.OPEN:
+            return max(0.0, OPEN_SEC - (time.monotonic() - self.opened_at))
+        return 1.0 if self.state == self.HALF_OPEN else 0.0
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probes = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= FAILURE_THRESHOLD:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.opened_total += 1
+            self.probes = 0
+
+
+class AIMDLimiter:
+    """Адаптивный лимит одновременных запросов к цели.
+
+    Успешный ответ быстрее AIMD_LATENCY_TARGET_MS прибавляет 1/limit
+    (≈ +1 за полное окно); 429/5xx/таймаут или медленный ответ умножают
+    лимит на AIMD_DECREASE, но не чаще раза в AIMD_COOLDOWN_SEC.
+    """
+
+    def __init__(self) -> None:
+        self.limit = min(max(AIMD_INITIAL, AIMD_MIN), AIMD_MAX)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, overloaded: bool, latency_ms: float) -> None:
+        now = time.monotonic()
+        if overloaded or latency_ms > AIMD_LATENCY_TARGET_MS:
+            if now - self._last_decrease >= AIMD_COOLDOWN_SEC:
+                self.limit = max(AIMD_MIN, self.limit * AIMD_DECREASE)
+                self._last_decrease = now
+        else:
+            self.limit = min(AIMD_MAX, self.limit + 1.0 / self.limit)
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+
+class TargetGuard:
+    def __init__(self) -> None:
+        self.breaker = CircuitBreaker()
+        self.limiter = AIMDLimiter()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "retry_after_sec": round(self.breaker.retry_after(), 1),
+            "opened_total": self.breaker.opened_total,
+            "concurrency_limit": round(self.limiter.limit, 2),
+            "in_flight": self.limiter.in_flight,
+        }
+
+
+_GUARDS: Dict[str, TargetGuard] = {}
+
+
+def guard_for(url: str) -> TargetGuard:
+    g = _GUARDS.get(url)
+    if g is None:
+        g = _GUARDS[url] = TargetGuard()
+    return g
+
+
+def breaker_stats() -> Dict[str, Any]:
+    return {url: g.snapshot() for url, g in _GUARDS.items()}
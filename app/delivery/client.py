@@ -1,27 +1,143 @@
-import os, json, time, random, hmac, hashlib
+import os, json, time, random, hmac, hashlib, asyncio
 import httpx
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlsplit
+from .breaker import CircuitOpen, guard_for
+
+try:
+    import h2  # noqa: F401  # нужен httpx для HTTP/2
+    _H2_AVAILABLE = True
+except ImportError:
+    _H2_AVAILABLE = False
 
 CHUNK_URL = os.getenv("MODULE2_WEBHOOK_CHUNK_URL", "http://module2:8000/v2/ingest/chunk")
 FINAL_URL = os.getenv("MODULE2_WEBHOOK_FINAL_URL", "http://module2:8000/v2/ingest/full")
+BATCH_URL = os.getenv("MODULE2_WEBHOOK_BATCH_URL", "http://module2:8000/v2/ingest/chunks:batch")
 INGEST_SECRET = os.getenv("INGEST_SECRET", "changeme")
 RETRIES = int(os.getenv("DELIVERY_RETRIES", "5"))
 BACKOFF_BASE_MS = int(os.getenv("DELIVERY_BACKOFF_BASE_MS", "500"))
+HTTP2 = os.getenv("DELIVERY_HTTP2", "true").lower() == "true"
+MAX_CONNECTIONS = int(os.getenv("DELIVERY_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE = int(os.getenv("DELIVERY_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY_SEC = float(os.getenv("DELIVERY_KEEPALIVE_EXPIRY_SEC", "30"))
+PER_HOST_CONNECTIONS = int(os.getenv("DELIVERY_PER_HOST_CONNECTIONS", "10"))
+TIMEOUT_SEC = float(os.getenv("DELIVERY_TIMEOUT_SEC", "10"))
+
+# Один клиент на всё время жизни приложения: keep-alive и HTTP/2
+# переиспользуют соединения к Mod2 вместо рукопожатия на каждый чанк.
+_client: Optional[httpx.AsyncClient] = None
+_host_slots: Dict[str, asyncio.Semaphore] = {}
+_in_flight: Dict[str, int] = {}
+_stats = {"requests": 0, "errors": 0, "latency_ms_total": 0.0, "latency_ms_max": 0.0, "last_latency_ms": 0.0}
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=TIMEOUT_SEC,
+            http2=HTTP2 and _H2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE,
+                keepalive_expiry=KEEPALIVE_EXPIRY_SEC,
+            ),
+        )
+    return _client
+
+
+async def aclose_client() -> None:
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
+    _host_slots.clear()
+
+
+async def post(url: str, content: bytes, headers: Dict[str, str], timeout: Optional[float] = None) -> httpx.Response:
+    """POST через общий клиент.
+
+    Пока цепь цели открыта, сразу бросает CircuitOpen; иначе ждёт места
+    в адаптивном (AIMD) лимите цели и в жёстком лимите на хост.
+    """
+    guard = guard_for(url)
+    if not guard.breaker.allow():
+        raise CircuitOpen(url, guard.breaker.retry_after())
+    host = urlsplit(url).netloc
+    slot = _host_slots.get(host)
+    if slot is None:
+        slot = _host_slots[host] = asyncio.Semaphore(PER_HOST_CONNECTIONS)
+    await guard.limiter.acquire()
+    overloaded = True
+    ms = 0.0
+    try:
+        async with slot:
+            _in_flight[host] = _in_flight.get(host, 0) + 1
+            t0 = time.perf_counter()
+            try:
+                kwargs: Dict[str, Any] = {"content": content, "headers": headers}
+                if timeout is not None:
+                    kwargs["timeout"] = timeout
+                resp = await get_client().post(url, **kwargs)
+                overloaded = resp.status_code == 429 or resp.status_code >= 500
+                return resp
+            except Exception:
+                _stats["errors"] += 1
+                raise
+            finally:
+                ms = (time.perf_counter() - t0) * 1000
+                _stats["requests"] += 1
+                _stats["latency_ms_total"] += ms
+                _stats["last_latency_ms"] = ms
+                _stats["latency_ms_max"] = max(_stats["latency_ms_max"], ms)
+                _in_flight[host] -= 1
+    finally:
+        if overloaded:
+            guard.breaker.record_failure()
+        else:
+            guard.breaker.record_success()
+        await guard.limiter.release(overloaded, ms)
+
+
+def delivery_stats() -> Dict[str, Any]:
+    out: Dict[str, Any] = dict(_stats)
+    out["latency_ms_avg"] = out["latency_ms_total"] / out["requests"] if out["requests"] else 0.0
+    out["http2"] = HTTP2 and _H2_AVAILABLE
+    out["in_flight"] = {h: n for h, n in _in_flight.items() if n}
+    # httpx не даёт публичного API для пула — смотрим внутрь аккуратно
+    pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+    conns = list(getattr(pool, "connections", []) or [])
+    out["connections"] = len(conns)
+    out["connections_idle"] = sum(1 for c in conns if getattr(c, "is_idle", lambda: False)())
+    return out
 
 def _signature(body: bytes) -> str:
     sig = hmac.new(INGEST_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
     return f"sha256={sig}"
 
-async def _post_json(url: str, payload: Dict[str, Any], idem_key: str) -> httpx.Response:
+async def _post_body(url: str, payload: Any, idem_key: str, request_id: str) -> httpx.Response:
     body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
     headers = {
         "Content-Type": "application/json",
         "X-Signature": _signature(body),
         "Idempotency-Key": idem_key,
-        "X-Request-Id": f"{payload['session_id']}:{payload.get('seq', 'final')}",
+        "X-Request-Id": request_id,
     }
-    async with httpx.AsyncClient(timeout=10) as client:
-        return await client.post(url, content=body, headers=headers)
+    return await post(url, body, headers)
+
+async def _post_json(url: str, payload: Dict[str, Any], idem_key: str) -> httpx.Response:
+    return await _post_body(url, payload, idem_key, f"{payload['session_id']}:{payload.get('seq', 'final')}")
+
+async def post_chunks_batch(chunks: List[Dict[str, Any]]) -> httpx.Response:
+    """Один POST с пачкой чанков одной сессии; идемпотентность Mod2 считает по каждому чанку."""
+    sid = chunks[0]["session_id"]
+    span = f"{chunks[0]['seq']}-{chunks[-1]['seq']}"
+    return await _post_body(BATCH_URL, chunks, f"{sid}:batch:{span}", f"{sid}:{span}")
+
+class _Pending:
+    # цепь открыта: доставка не выполнялась, запись остаётся ожидающей
+    status_code = 503
+    text = "circuit open, delivery pending"
 
 async def _deliver_with_retries(url: str, payload: Dict[str, Any], idem_key: str):
     for attempt in range(RETRIES + 1):
@@ -36,6 +152,9 @@ async def _deliver_with_retries(url: str, payload: Dict[str, Any], idem_key: str
             if 400 <= resp.status_code < 500:
                 return resp
             return resp
+        except CircuitOpen:
+            # не спим в ретраях вместе со всеми: Mod2 лежит — сразу отдаём pending
+            return _Pending()
         except Exception:
             # таймаут/сетевые/5xx
             delay = (BACKOFF_BASE_MS / 1000.0) * (2 ** attempt) + random.uniform(0, 0.5)
@@ -0,0 +1,312 @@
+from __future__ import annotations
+import os, json, asyncio, logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+from sqlalchemy import func, insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..db import get_async_session
+from ..models import OutboxModel, ChunkModel
+from ..services import metrics
+from ..services.webhooks import get_active_webhook, post_webhook
+from .breaker import CircuitOpen
+from .client import CHUNK_URL, FINAL_URL, BACKOFF_BASE_MS, _post_json, post_chunks_batch
+
+logger = logging.getLogger(__name__)
+
+CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "8"))
+POLL_SEC = float(os.getenv("OUTBOX_POLL_SEC", "2"))
+BATCH = int(os.getenv("OUTBOX_BATCH", "200"))
+MAX_BACKOFF_SEC = float(os.getenv("OUTBOX_MAX_BACKOFF_SEC", "60"))
+# сколько подряд идущих чанков сессии отправлять одним запросом (1 — без пачек)
+BATCH_CHUNKS = int(os.getenv("OUTBOX_BATCH_CHUNKS", "50"))
+
+# chunk — в Mod2 (CHUNK_URL), webhook — live-чанк на активный вебхук
+CHUNK_KINDS = ("chunk", "webhook")
+
+
+async def enqueue_many(s: AsyncSession, items: Sequence[Tuple[str, Dict[str, Any], str]]) -> None:
+    """Добавляет записи (kind, payload, idem_key) в outbox одним executemany
+    в рамках транзакции вызывающего.
+
+    Порядок items сохраняется в порядке id, по которому идёт доставка.
+    Ключи, уже ожидающие доставки или доставленные, пропускаются: chunk_id
+    детерминирован, так что повтор той же обработки в Mod2 не уходит.
+    Записи со статусом failed или cancelled ставятся заново.
+    """
+    if not items:
+        return
+    sessions = {payload["session_id"] for _kind, payload, _key in items}
+    queued = set((await s.exec(
+        select(OutboxModel.idem_key)
+        .where(OutboxModel.session_id.in_(sessions), OutboxModel.status.notin_(("failed", "cancelled")))
+    )).all())
+    items = [it for it in items if it[2] not in queued]
+    if not items:
+        return
+    now = datetime.utcnow()
+    rows = [
+        {
+            "session_id": payload["session_id"],
+            "kind": kind,
+            "chunk_id": payload.get("chunk_id"),
+            "seq": payload.get("seq"),
+            "payload_json": json.dumps(payload, ensure_ascii=False),
+            "idem_key": idem_key,
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "last_error": "",
+            "created_at": now,
+            "delivered_at": None,
+        }
+        for kind, payload, idem_key in items
+    ]
+    conn = await s.connection()
+    await conn.execute(insert(OutboxModel.__table__), rows)
+
+
+class OutboxDispatcher:
+    """Фоновая доставка outbox в Модуль 2.
+
+    Внутри сессии записи уходят строго по порядку id (чанки, затем финал);
+    разные сессии доставляются параллельно, не больше CONCURRENCY запросов
+    одновременно. Подряд идущие чанки сессии уходят одной пачкой на
+    /v2/ingest/chunks:batch; если Mod2 её не поддерживает (404/405),
+    диспетчер переходит на поштучную отправку. Неудачная попытка
+    откладывает записи с экспоненциальной задержкой; запись остаётся в
+    таблице, пока не будет доставлена. Записи webhook — live-чанки, не
+    ушедшие на активный вебхук, — доставляются туда же с его подписью.
+    """
+
+    def __init__(self) -> None:
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._slots = asyncio.Semaphore(CONCURRENCY)
+        self._busy: Set[str] = set()
+        self._batch_supported = BATCH_CHUNKS > 1
+        self.batches = 0
+        self.deferred = 0
+        self.delivered = 0
+        self.failed = 0
+        self.retried = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self._dispatch_once()
+            except Exception:
+                logger.exception("outbox dispatch failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=POLL_SEC)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _dispatch_once(self) -> None:
+        # голова каждой сессии — её первая ожидающая запись; лимит применяется
+        # к головам, которым пора, чтобы сессия в backoff не занимала выборку
+        heads = (
+            select(func.min(OutboxModel.id))
+            .where(OutboxModel.status == "pending")
+            .group_by(OutboxModel.session_id)
+        )
+        async with get_async_session() as s:
+            sessions = (await s.exec(
+                select(OutboxModel.session_id)
+                .where(
+                    OutboxModel.id.in_(heads),
+                    OutboxModel.next_attempt_at <= datetime.utcnow(),
+                    OutboxModel.session_id.notin_(self._busy),
+                )
+                .order_by(OutboxModel.id)
+                .limit(BATCH)
+            )).all()
+        for sid in sessions:
+            self._busy.add(sid)
+            asyncio.create_task(self._drain_session(sid))
+
+    async def _next_pending(self, session_id: str, limit: int) -> List[OutboxModel]:
+        async with get_async_session() as s:
+            return list((await s.exec(
+                select(OutboxModel)
+                .where(OutboxModel.session_id == session_id, OutboxModel.status == "pending")
+                .order_by(OutboxModel.id)
+                .limit(limit)
+            )).all())
+
+    async def _drain_session(self, session_id: str) -> None:
+        try:
+            while True:
+                rows = await self._next_pending(session_id, BATCH_CHUNKS if self._batch_supported else 1)
+                if not rows or rows[0].next_attempt_at > datetime.utcnow():
+                    return
+                batch: List[OutboxModel] = []
+                for row in rows:
+                    if row.kind != "chunk":
+                        break
+                    batch.append(row)
+                if self._batch_supported and len(batch) > 1:
+                    ok = await self._deliver_batch(batch)
+                else:
+                    ok = await self._deliver(rows[0])
+                if not ok:
+                    return
+        except Exception:
+            logger.exception("outbox drain failed", extra={"session_id": session_id})
+        finally:
+            self._busy.discard(session_id)
+
+    async def _deliver(self, row: OutboxModel) -> bool:
+        """Одна попытка доставки; True — можно переходить к следующей записи."""
+        url = CHUNK_URL if row.kind == "chunk" else FINAL_URL
+        error = ""
+        status_code = 0
+        async with self._slots:
+            try:
+                if row.kind == "webhook":
+                    # live-чанк после неудачной отправки: тот же вебхук и та же подпись
+                    webhook = await get_active_webhook()
+                    if webhook is None:
+                        await self._mark_done([row], [False], "no_webhook")
+                        return True
+                    resp = await post_webhook(webhook, json.loads(row.payload_json))
+                else:
+                    resp = await _post_json(url, json.loads(row.payload_json), row.idem_key)
+                status_code = resp.status_code
+            except CircuitOpen as e:
+                await self._defer([row], e.retry_after)
+                return False
+            except Exception as e:
+                error = repr(e)
+        if status_code and (status_code < 400 or (status_code < 500 and status_code != 429)):
+            await self._mark_done([row], [status_code < 400], f"http_{status_code}")
+            return True
+        await self._mark_retry([row], error or f"http_{status_code}")
+        return False
+
+    async def _deliver_batch(self, rows: List[OutboxModel]) -> bool:
+        error = ""
+        status_code = 0
+        body: Any = None
+        async with self._slots:
+            try:
+                resp = await post_chunks_batch([json.loads(r.payload_json) for r in rows])
+                status_code = resp.status_code
+                if status_code < 300:
+                    try:
+                        body = resp.json()
+                    except ValueError:
+                        body = None
+            except CircuitOpen as e:
+                await self._defer(rows, e.retry_after)
+                return False
+            except Exception as e:
+                error = repr(e)
+        if status_code in (404, 405):
+            # Mod2 без пакетного эндпоинта — дальше отправляем поштучно
+            self._batch_supported = False
+            return True
+        if status_code and 400 <= status_code < 500 and status_code != 429:
+            # как в _deliver: остальные 4xx повтором не исправить
+            await self._mark_done(rows, [False] * len(rows), f"http_{status_code}")
+            return True
+        if status_code and status_code < 300:
+            self.batches += 1
+            results = body.get("results") if isinstance(body, dict) else None
+            if not isinstance(results, list) or not all(isinstance(r, dict) for r in results):
+                if not isinstance(body, dict) or results is not None:
+                    # пачка принята, но без разбора по элементам: повтор дал бы то же самое
+                    logger.warning("outbox batch: unexpected 2xx body, counting batch as delivered",
+                                   extra={"session_id": rows[0].session_id, "status": status_code})
+                ok = [True] * len(rows)
+            else:
+                by_index = {r.get("index"): r.get("status") for r in results}
+                ok = [by_index.get(i) in ("ok", "idempotent") for i in range(len(rows))]
+            await self._mark_done(rows, ok, "invalid")
+            return True
+        await self._mark_retry(rows, error or f"http_{status_code}")
+        return False
+
+    async def _mark_done(self, rows: List[OutboxModel], ok: List[bool], error: str) -> None:
+        now = datetime.utcnow()
+        delivered_chunks: List[str] = []
+        async with get_async_session() as s:
+            for row, good in zip(rows, ok):
+                r = await s.get(OutboxModel, row.id)
+                if r is None:
+                    continue
+                r.attempts += 1
+                if good:
+                    r.status = "delivered"
+                    r.delivered_at = now
+                    self.delivered += 1
+                    if r.kind in CHUNK_KINDS and r.chunk_id:
+                        delivered_chunks.append(r.chunk_id)
+                        # от постановки в outbox до подтверждения Mod2
+                        metrics.CHUNK_DELIVERY.observe((now - r.created_at).total_seconds(), path="outbox")
+                else:
+                    # 4xx (кроме 429) и невалидные элементы пачки повтором не исправить —
+                    # оставляем запись для разбора
+                    r.status = "failed"
+                    r.last_error = error
+                    self.failed += 1
+                s.add(r)
+            if delivered_chunks:
+                for ch in await s.exec(select(ChunkModel).where(ChunkModel.chunk_id.in_(delivered_chunks))):
+                    ch.delivered_at = now
+                    s.add(ch)
+            await s.commit()
+
+    async def _mark_retry(self, rows: List[OutboxModel], error: str) -> None:
+        async with get_async_session() as s:
+            for row in rows:
+                r = await s.get(OutboxModel, row.id)
+                if r is None:
+                    continue
+                r.attempts += 1
+                delay = min(MAX_BACKOFF_SEC, (BACKOFF_BASE_MS / 1000.0) * (2 ** min(r.attempts - 1, 16)))
+                r.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                r.last_error = error[:500]
+                s.add(r)
+            await s.commit()
+        self.retried += 1
+
+    async def _defer(self, rows: List[OutboxModel], delay: float) -> None:
+        """Цепь открыта: откладываем записи до её полуоткрытия, попытку не считаем."""
+        async with get_async_session() as s:
+            for row in rows:
+                r = await s.get(OutboxModel, row.id)
+                if r is None:
+                    continue
+                r.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                s.add(r)
+            await s.commit()
+        self.deferred += len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions_in_flight": len(self._busy),
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "retried": self.retried,
+            "batches": self.batches,
+            "deferred": self.deferred,
+            "batch_endpoint": self._batch_supported,
+        }
+
+
+DISPATCHER = OutboxDispatcher()
@@ -1,11 +1,19 @@
 from __future__ import annotations
+import asyncio
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from .utils.logging import setup_json_logging
-from .db import init_db
+from .utils.limits import UploadLimitMiddleware
+from .db import init_db, async_engine
 from .config import settings
-from .routers import health, hooks, transcribe, stream, session
+from .routers import health, hooks, transcribe, stream, session, metrics
+from .services.asr import ASR_ENGINE
+from .services.workers import ASR_EXECUTOR
+from .services.sessions import SESSION_MANAGER
+from .services.affinity import AFFINITY
+from .delivery.client import aclose_client
+from .delivery.outbox import DISPATCHER
 
 setup_json_logging(settings.app.log_level)
 init_db()
@@ -21,7 +29,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# лимит тарифа на размер загрузки — до того, как FastAPI сохранит файл
+app.add_middleware(UploadLimitMiddleware)
+
+@app.on_event("startup")
+async def _startup():
+    SESSION_MANAGER.start()
+    DISPATCHER.start()
+    await AFFINITY.start()
+    # Загружаем модели Whisper заранее, чтобы первый запрос не платил за загрузку
+    if settings.asr.warmup:
+        await asyncio.to_thread(ASR_ENGINE.warmup)
+
+@app.on_event("shutdown")
+async def _shutdown():
+    # сессии, не переданные через /v1/stream/drain, уходят другим воркерам здесь
+    await AFFINITY.drain()
+    await AFFINITY.stop()
+    await SESSION_MANAGER.shutdown()
+    await DISPATCHER.stop()
+    await aclose_client()
+    ASR_EXECUTOR.shutdown()
+    await async_engine.dispose()
+
 app.include_router(health.router)
+app.include_router(metrics.router)
 app.include_router(hooks.router)
 app.include_router(transcribe.router)
 app.include_router(session.router)
@@ -1,6 +1,7 @@
 from __future__ import annotations
 import uuid
 from datetime import datetime
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 
 class SessionModel(SQLModel, table=True):
@@ -15,8 +16,10 @@ class SessionModel(SQLModel, table=True):
 
 class TranscriptModel(SQLModel, table=True):
     __tablename__ = "transcripts"
+    # один транскрипт на сессию: повторная обработка обновляет его (upsert)
+    __table_args__ = (Index("ux_transcripts_session", "session_id", unique=True),)
     id: str = Field(primary_key=True, default_factory=lambda: str(uuid.uuid4()))
-    session_id: str = Field(foreign_key="sessions.id", index=True)
+    session_id: str = Field(foreign_key="sessions.id")
     text_full: str = Field(default="")
     duration_sec: float = 0.0
     total_chunks: int = 0
@@ -25,6 +28,9 @@ class TranscriptModel(SQLModel, table=True):
 
 class ChunkModel(SQLModel, table=True):
     __tablename__ = "chunks"
+    # keyset-пагинация GET /v1/session/{sid}/chunks идёт по (session_id, seq);
+    # уникальность даёт upsert при повторной обработке той же сессии
+    __table_args__ = (Index("ux_chunks_session_seq", "session_id", "seq", unique=True),)
     id: str = Field(primary_key=True, default_factory=lambda: str(uuid.uuid4()))
     session_id: str = Field(foreign_key="sessions.id", index=True)
     chunk_id: str = Field(index=True)
@@ -34,6 +40,8 @@ class ChunkModel(SQLModel, table=True):
     lang: str = "ru-RU"
     policy_json: str = ""
     hash: str
+    start_sec: float | None = None  # таймкоды чанка в аудио, если известны
+    end_sec: float | None = None
     created_at: datetime = Field(default_factory=lambda: datetime.utcnow())
     delivered_at: datetime | None = None
 
@@ -43,4 +51,35 @@ class WebhookModel(SQLModel, table=True):
     url: str
     secret: str
     active: bool = True
-    created_at: datetime = Field(default_factory=lambda: datetime.utcnow())
\ No newline at end of file
+    created_at: datetime = Field(default_factory=lambda: datetime.utcnow())
+
+class OutboxModel(SQLModel, table=True):
+    __tablename__ = "outbox"
+    id: int | None = Field(default=None, primary_key=True)
+    session_id: str = Field(foreign_key="sessions.id", index=True)
+    kind: str  # chunk | webhook | final
+    chunk_id: str | None = None
+    seq: int | None = None
+    payload_json: str
+    idem_key: str
+    status: str = Field(default="pending", index=True)  # pending | delivered | failed | cancelled
+    attempts: int = 0
+    next_attempt_at: datetime = Field(default_factory=lambda: datetime.utcnow())
+    last_error: str = ""
+    created_at: datetime = Field(default_factory=lambda: datetime.utcnow())
+    delivered_at: datetime | None = None
+
+class LiveNodeModel(SQLModel, table=True):
+    """Живые воркеры для кольца affinity; строка продлевается heartbeat'ом."""
+    __tablename__ = "live_nodes"
+    id: str = Field(primary_key=True)
+    url: str = ""
+    expires_at: datetime = Field(default_factory=lambda: datetime.utcnow(), index=True)
+
+class LiveOwnerModel(SQLModel, table=True):
+    """Владелец live-сессии и снимок LiveState на время передачи между воркерами."""
+    __tablename__ = "live_owners"
+    session_id: str = Field(primary_key=True)
+    node_id: str | None = None
+    handoff_json: str | None = None
+    updated_at: datetime = Field(default_factory=lambda: datetime.utcnow())
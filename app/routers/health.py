@@ -2,6 +2,14 @@ from __future__ import annotations
 from fastapi import APIRouter
 import os
 from datetime import datetime
+from ..services.asr import MODEL_POOL
+from ..services.asr_cache import ASR_CACHE
+from ..services.workers import ASR_EXECUTOR
+from ..services.sessions import SESSION_MANAGER
+from ..services.affinity import AFFINITY
+from ..delivery.client import delivery_stats
+from ..delivery.breaker import breaker_stats
+from ..delivery.outbox import DISPATCHER
 
 router = APIRouter()
 
@@ -19,5 +27,13 @@ async def healthz():
         "version": os.getenv("APP_VERSION", "1.0.0"),
         "host": host,
         "port": port,
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": datetime.utcnow().isoformat(),
+        "asr_pool": MODEL_POOL.stats(),
+        "asr_queue": ASR_EXECUTOR.stats(),
+        "asr_cache": ASR_CACHE.stats(),
+        "live_sessions": SESSION_MANAGER.scheduler_stats(),
+        "affinity": AFFINITY.stats(),
+        "delivery": delivery_stats(),
+        "outbox": DISPATCHER.stats(),
+        "breakers": breaker_stats(),
     }
\ No newline at end of file
@@ -0,0 +1,35 @@
+from __future__ import annotations
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from ..config import settings
+from ..services import metrics
+from ..services.sessions import SESSION_MANAGER
+from ..services.workers import ASR_EXECUTOR
+
+router = APIRouter()
+
+
+def _live_sessions() -> dict:
+    states = list(SESSION_MANAGER.states.values())
+    open_ = sum(1 for st in states if not st.closed)
+    return {(settings.app.tier, "open"): open_, (settings.app.tier, "closed"): len(states) - open_}
+
+
+def _asr_queue() -> dict:
+    st = ASR_EXECUTOR.stats()
+    return {(settings.app.tier, "running"): st["running"], (settings.app.tier, "queued"): st["queued"]}
+
+
+metrics.Gauge(
+    "mod1_live_sessions_memory_bytes",
+    "Estimated memory held by LiveState entries",
+    lambda: {(settings.app.tier,): SESSION_MANAGER.memory_bytes()},
+    ["tier"],
+)
+metrics.Gauge("mod1_live_sessions", "LiveState entries in SESSION_MANAGER", _live_sessions, ["tier", "state"])
+metrics.Gauge("mod1_asr_queue", "ASR executor jobs", _asr_queue, ["tier", "state"])
+
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
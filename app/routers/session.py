@@ -1,34 +1,71 @@
 from __future__ import annotations
-from fastapi import APIRouter, HTTPException
+from typing import Any, AsyncIterator, Dict
+import orjson
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlmodel import select
-from ..db import get_session
+from ..db import get_async_session
 from ..models import TranscriptModel, ChunkModel
 
 router = APIRouter(prefix="/v1/session")
 
+# сколько строк курсор забирает из БД за раз при NDJSON-выгрузке
+STREAM_FETCH = 500
+
 @router.get("/{sid}/text")
 async def get_text(sid: str):
-    with get_session() as s:
-        tr = s.exec(select(TranscriptModel).where(TranscriptModel.session_id == sid)).first()
+    async with get_async_session() as s:
+        tr = (await s.exec(select(TranscriptModel).where(TranscriptModel.session_id == sid))).first()
         if not tr:
             raise HTTPException(404, "not found")
         return {"session_id": sid, "text_full": tr.text_full, "lang": tr.lang}
 
+def _chunk_out(it: ChunkModel) -> Dict[str, Any]:
+    return {
+        "session_id": it.session_id,
+        "chunk_id": it.chunk_id,
+        "seq": it.seq,
+        "text": it.text,
+        "overlap_prefix": it.overlap_prefix,
+        "lang": it.lang,
+        "policy": it.policy_json,
+        "hash": it.hash,
+        "start_sec": it.start_sec,
+        "end_sec": it.end_sec,
+        "created_at": it.created_at.isoformat() + "Z"
+    }
+
+def _chunks_query(sid: str, after_seq: int):
+    return (
+        select(ChunkModel)
+        .where(ChunkModel.session_id == sid, ChunkModel.seq > after_seq)
+        .order_by(ChunkModel.seq.asc())
+    )
+
 @router.get("/{sid}/chunks")
-async def get_chunks(sid: str):
-    with get_session() as s:
-        items = s.exec(select(ChunkModel).where(ChunkModel.session_id == sid).order_by(ChunkModel.seq.asc())).all()
-        out = []
-        for it in items:
-            out.append({
-                "session_id": it.session_id,
-                "chunk_id": it.chunk_id,
-                "seq": it.seq,
-                "text": it.text,
-                "overlap_prefix": it.overlap_prefix,
-                "lang": it.lang,
-                "policy": it.policy_json,
-                "hash": it.hash,
-                "created_at": it.created_at.isoformat() + "Z"
-            })
-        return out
\ No newline at end of file
+async def get_chunks(
+    sid: str,
+    response: Response,
+    after_seq: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=5000),
+):
+    """Страница чанков с seq > after_seq.
+
+    Если страница заполнена целиком, X-Next-After-Seq содержит after_seq
+    для следующего запроса.
+    """
+    async with get_async_session() as s:
+        items = (await s.exec(_chunks_query(sid, after_seq).limit(limit))).all()
+    if len(items) == limit:
+        response.headers["X-Next-After-Seq"] = str(items[-1].seq)
+    return [_chunk_out(it) for it in items]
+
+@router.get("/{sid}/chunks.ndjson")
+async def stream_chunks(sid: str, after_seq: int = Query(0, ge=0)):
+    """Все чанки сессии построчно (NDJSON) через серверный курсор."""
+    async def rows() -> AsyncIterator[bytes]:
+        async with get_async_session() as s:
+            result = await s.stream(_chunks_query(sid, after_seq).execution_options(yield_per=STREAM_FETCH))
+            async for it in result.scalars():
+                yield orjson.dumps(_chunk_out(it)) + b"\n"
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
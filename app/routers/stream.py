@@ -1,10 +1,150 @@
 from __future__ import annotations
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
-import json
-from ..services.sessions import SESSION_MANAGER
+import asyncio, json, time
+from typing import Any, Dict, Optional, Set
+from ..config import settings
+from ..services.affinity import AFFINITY
+from ..services.sessions import SESSION_MANAGER, SessionClosed, SessionDetached, SessionLimitExceeded
+from ..services.workers import ASR_EXECUTOR
 
 router = APIRouter()
 
+PROTOCOLS = (1, 2)
+# сессию ведёт другой воркер: клиент переподключается по url из сообщения redirect
+REDIRECT_CLOSE_CODE = 4307
+_STOP = object()
+# задачи hand_off живут дольше обработчика события — держим ссылки, чтобы их не собрал GC
+_handoff_tasks: Set[asyncio.Task] = set()
+
+
+class _PushChannel:
+    """Исходящая сторона протокола 2.
+
+    Вместо progress на каждый кадр — накопительный ack раз в ack_frames
+    кадров или ack_ms мс; partial и chunk приходят от SessionManager сразу
+    после обработки; slow_down/resume отражают загрузку очереди ASR и
+    отставание обработки сессии (с гистерезисом). Все отправки идут из
+    одной задачи, так что кадры не перемешиваются. Если отправка упала
+    (клиент ушёл), канал сразу отписывается и больше не копит события.
+    """
+
+    def __init__(self, ws: WebSocket, session_id: str, ack_frames: int, ack_ms: int, emit_partial: bool) -> None:
+        self.ws = ws
+        self.session_id = session_id
+        self.ack_frames = ack_frames
+        self.ack_ms = ack_ms
+        self.emit_partial = emit_partial
+        self.frames = 0
+        self.bytes = 0
+        self._acked = 0
+        self._first_unacked = 0.0
+        self.slowed = False
+        self._events: "asyncio.Queue[Any]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def params(self) -> Dict[str, Any]:
+        return {"protocol": 2, "ack_frames": self.ack_frames, "ack_ms": self.ack_ms}
+
+    def start(self) -> None:
+        SESSION_MANAGER.subscribe(self.session_id, self._on_event)
+        self._task = asyncio.create_task(self._run())
+        self._task.add_done_callback(self._on_done)
+
+    def _on_done(self, _task: asyncio.Task) -> None:
+        SESSION_MANAGER.unsubscribe(self.session_id, self._on_event)
+
+    @property
+    def alive(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def send(self, event: Dict[str, Any]) -> None:
+        """Ставит служебное сообщение в общую очередь отправки."""
+        if self.alive:
+            self._events.put_nowait(event)
+
+    async def stop(self) -> None:
+        """Дожидается отправки уже поставленных событий и последнего ack."""
+        SESSION_MANAGER.unsubscribe(self.session_id, self._on_event)
+        if self._task is not None:
+            self._events.put_nowait(_STOP)
+            try:
+                await self._task
+            except Exception:
+                pass  # отправка уже не удалась — клиент отключился
+            self._task = None
+
+    def cancel(self) -> None:
+        SESSION_MANAGER.unsubscribe(self.session_id, self._on_event)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _on_event(self, event: Dict[str, Any]) -> None:
+        if event.get("type") == "handoff" or (event.get("type") == "partial" and not self.emit_partial):
+            return
+        self.send(event)
+
+    def frame(self, size: int) -> None:
+        if self.frames == self._acked:
+            self._first_unacked = time.monotonic()
+        self.frames += 1
+        self.bytes += size
+        if self.frames - self._acked >= self.ack_frames and self.alive:
+            self._events.put_nowait(None)  # разбудить отправителя
+
+    async def _run(self) -> None:
+        while True:
+            if self.frames > self._acked:
+                timeout = max(0.0, self._first_unacked + self.ack_ms / 1000.0 - time.monotonic())
+            else:
+                timeout = self.ack_ms / 1000.0
+            try:
+                event = await asyncio.wait_for(self._events.get(), timeout)
+            except asyncio.TimeoutError:
+                event = None
+            if event is _STOP:
+                await self._ack(force=True)
+                return
+            if event is not None:
+                await self.ws.send_text(json.dumps(event, ensure_ascii=False))
+            await self._ack()
+            await self._flow()
+
+    async def _ack(self, force: bool = False) -> None:
+        pending = self.frames - self._acked
+        if not pending:
+            return
+        due = time.monotonic() - self._first_unacked >= self.ack_ms / 1000.0
+        if force or due or pending >= self.ack_frames:
+            self._acked = self.frames
+            await self.ws.send_text(json.dumps({
+                "type": "ack", "session_id": self.session_id, "frames": self.frames, "bytes": self.bytes,
+            }))
+
+    async def _flow(self) -> None:
+        load = ASR_EXECUTOR.load()
+        lagging = SESSION_MANAGER.lagging(self.session_id)
+        if not self.slowed and (lagging or load >= settings.app.ws_slow_down_load):
+            self.slowed = True
+            await self.ws.send_text(json.dumps({
+                "type": "slow_down",
+                "session_id": self.session_id,
+                "reason": "session_backlog" if lagging else "asr_queue",
+                "load": round(load, 3),
+                "retry_after_ms": settings.asr.retry_after_sec * 1000,
+            }))
+        elif self.slowed and not lagging and load <= settings.app.ws_resume_load:
+            self.slowed = False
+            await self.ws.send_text(json.dumps({"type": "resume", "session_id": self.session_id, "load": round(load, 3)}))
+
+
+def _clamp(value: Any, default: int, lo: int, hi: int) -> int:
+    try:
+        return max(lo, min(hi, int(value)))
+    except (TypeError, ValueError):
+        return default
+
+
 @router.websocket("/v1/stream")
 async def ws_stream(
     ws: WebSocket,
@@ -12,26 +152,150 @@ async def ws_stream(
     lang: str = Query("ru-RU"),
     emit_partial: bool = Query(True),
     chunking: str = Query("on"),
+    protocol: int = Query(1),
+    ack_frames: int = Query(0),
+    ack_ms: int = Query(0),
 ):
+    """Live-сессия.
+
+    Протокол 1 (по умолчанию): на каждый бинарный кадр — progress.
+    Протокол 2 выбирается ?protocol=2 или текстовым кадром
+    {"type": "hello", "protocol": 2, "ack_frames": N, "ack_ms": T} до первого
+    аудиокадра; сервер подтверждает его своим hello и дальше шлёт ack,
+    partial, chunk, slow_down и resume. eos и final_full — как в протоколе 1.
+
+    При включённом affinity сессию ведёт один воркер: остальные отвечают
+    redirect с его адресом и закрывают соединение кодом 4307. Тот же
+    redirect получает клиент, чью сессию воркер передал другому при drain.
+    """
     await ws.accept()
-    await ws.send_text(json.dumps({"type": "hello", "session_id": session_id}))
+    push: Optional[_PushChannel] = None
+
+    async def redirect(url: str) -> None:
+        await ws.send_text(json.dumps({
+            "type": "redirect",
+            "session_id": session_id,
+            "url": f"{url}{ws.url.path}?{ws.url.query}" if url else "",
+        }))
+        # адрес владельца неизвестен — 1012 Service Restart, клиент переподключится через балансировщик
+        await ws.close(code=REDIRECT_CLOSE_CODE if url else 1012)
+
+    owner_url = await AFFINITY.route(session_id)
+    if owner_url is not None:
+        await redirect(owner_url)
+        return
+    await AFFINITY.adopt(session_id)
+
+    async def hand_off(url: str) -> None:
+        if push:
+            await push.stop()
+        try:
+            await redirect(url)
+        except Exception:
+            pass
+
+    def on_handoff(event: Dict[str, Any]) -> None:
+        if event.get("type") == "handoff":
+            task = asyncio.create_task(hand_off(event.get("url", "")))
+            _handoff_tasks.add(task)
+            task.add_done_callback(_handoff_tasks.discard)
+
+    SESSION_MANAGER.subscribe(session_id, on_handoff)
+
+    def negotiate(ver: Any, frames: Any, ms: Any) -> Optional[_PushChannel]:
+        if _clamp(ver, 1, 1, PROTOCOLS[-1]) != 2:
+            return None
+        return _PushChannel(
+            ws, session_id,
+            _clamp(frames or settings.app.ws_ack_frames, settings.app.ws_ack_frames, 1, 1000),
+            _clamp(ms or settings.app.ws_ack_ms, settings.app.ws_ack_ms, 50, 10000),
+            emit_partial and settings.app.emit_partial,
+        )
+
+    async def close() -> Dict[str, Any]:
+        final = await SESSION_MANAGER.close_session(session_id, lang)
+        await AFFINITY.forget(session_id)
+        return final
+
+    push = negotiate(protocol, ack_frames, ack_ms)
+    hello: Dict[str, Any] = {"type": "hello", "session_id": session_id, "protocols": list(PROTOCOLS)}
+    hello.update(push.params() if push else {"protocol": 1})
+    await ws.send_text(json.dumps(hello))
+    if push:
+        push.start()
+    audio_started = False
     try:
         while True:
             msg = await ws.receive()
+            if msg.get("type") == "websocket.disconnect":
+                raise WebSocketDisconnect(msg.get("code", 1000))
             if "bytes" in msg and msg["bytes"]:
-                await SESSION_MANAGER.append_audio(session_id, lang, msg["bytes"])
-                await ws.send_text(json.dumps({"type": "progress", "session_id": session_id}))
+                audio_started = True
+                try:
+                    await SESSION_MANAGER.append_audio(session_id, lang, msg["bytes"])
+                except SessionLimitExceeded:
+                    if push:
+                        push.cancel()
+                    # 1013 Try Again Later: процесс обслуживает максимум live-сессий
+                    await ws.send_text(json.dumps({"type": "error", "code": "too_many_sessions", "session_id": session_id}))
+                    await ws.close(code=1013)
+                    break
+                except SessionClosed:
+                    if push:
+                        push.cancel()
+                    # 1008 Policy Violation: session_id уже закрытой сессии не переиспользуется
+                    await ws.send_text(json.dumps({"type": "error", "code": "session_closed", "session_id": session_id}))
+                    await ws.close(code=1008)
+                    break
+                except SessionDetached:
+                    continue  # сессия уже у другого воркера, redirect в пути
+                if push:
+                    push.frame(len(msg["bytes"]))
+                else:
+                    await ws.send_text(json.dumps({"type": "progress", "session_id": session_id}))
             elif "text" in msg and msg["text"]:
                 try:
                     payload = json.loads(msg["text"])
                 except Exception:
                     payload = {"type": "text", "value": msg["text"]}
-                if payload.get("type") == "eos":
-                    final = await SESSION_MANAGER.close_session(session_id, lang)
+                if not isinstance(payload, dict):
+                    payload = {"type": "text", "value": payload}
+                if payload.get("type") == "hello":
+                    # ответ есть всегда; протокол меняется только до первого аудиокадра
+                    running = push is not None
+                    if not running and not audio_started:
+                        push = negotiate(payload.get("protocol"), payload.get("ack_frames"), payload.get("ack_ms"))
+                    reply = {"type": "hello", "session_id": session_id, "protocols": list(PROTOCOLS)}
+                    reply.update(push.params() if push else {"protocol": 1})
+                    if running:
+                        push.send(reply)
+                    else:
+                        await ws.send_text(json.dumps(reply))
+                        if push:
+                            push.start()
+                elif payload.get("type") == "eos":
+                    if SESSION_MANAGER.is_detached(session_id):
+                        continue  # eos дойдёт до нового владельца после redirect
+                    final = await close()
+                    if push:
+                        await push.stop()
                     await ws.send_text(json.dumps({"type": "final_full", "payload": final}, ensure_ascii=False))
                     await ws.close()
                     break
             else:
                 pass
     except WebSocketDisconnect:
-        await SESSION_MANAGER.close_session(session_id, lang)
\ No newline at end of file
+        if push:
+            push.cancel()
+        # сессия передана другому воркеру — закрывать её нельзя
+        if session_id in SESSION_MANAGER.states:
+            await close()
+    finally:
+        SESSION_MANAGER.unsubscribe(session_id, on_handoff)
+
+
+@router.post("/v1/stream/drain")
+async def drain():
+    """Передаёт открытые live-сессии другим воркерам (preStop перед остановкой)."""
+    moved = await AFFINITY.drain()
+    return {"node_id": AFFINITY.node_id, "sessions": moved}
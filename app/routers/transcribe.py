@@ -1,16 +1,22 @@
 from __future__ import annotations
 from fastapi import APIRouter, UploadFile, File, Query, HTTPException
 from pydantic import BaseModel
-import tempfile, os
+import asyncio, hashlib, tempfile, os
 import time
 import logging
 
-from ..services.asr import ASREngine
-from ..services.chunker import split_sentences, make_chunks
-from ..db import get_session
-from ..models import SessionModel, TranscriptModel, ChunkModel
+from ..services.asr import ASR_ENGINE
+from ..services.audio import probe_duration
+from ..services.asr_cache import ASR_CACHE, cache_key
+from ..services.long_asr import transcribe_path
+from ..services import metrics
+from ..services.workers import QueueFull
+from ..services.chunker import split_sentences, make_chunks, sentence_times
+from ..db import get_async_session
+from ..models import SessionModel
+from ..services.store import save_transcript
 from ..config import settings
-from ..delivery.client import deliver_chunk, deliver_final
+from ..delivery.outbox import enqueue_many, DISPATCHER
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -21,6 +27,7 @@ router = APIRouter(prefix="/v1")
 class BatchOut(BaseModel):
     session_id: str
     text_full: str
+    duration_sec: float = 0.0
     chunks: list[dict]
 
 
@@ -31,6 +38,9 @@ async def transcribe(
     lang: str = Query(default="ru-RU"),
 ):
     size = 0
+    digest = hashlib.sha256()
+    limits = settings.limits[settings.app.tier]
+    limit_bytes = limits.max_file_mb * 1024 * 1024
     with tempfile.NamedTemporaryFile(
         suffix=os.path.splitext(file.filename or "")[-1] or ".webm", delete=False
     ) as f:
@@ -38,21 +48,45 @@ async def transcribe(
             chunk = await file.read(1024 * 1024)
             if not chunk:
                 break
-            f.write(chunk)
             size += len(chunk)
+            if size > limit_bytes:
+                # тело уже ограничено UploadLimitMiddleware; здесь — точный размер файла
+                break
+            f.write(chunk)
+            digest.update(chunk)
         path = f.name
 
-    limit_mb = settings.limits[settings.app.tier].max_file_mb
-    if size > limit_mb * 1024 * 1024:
+    if size > limit_bytes:
         os.remove(path)
         raise HTTPException(413, f"file too large for tier {settings.app.tier}")
 
+    # длительность по заголовкам — до постановки в очередь ASR
+    duration = await asyncio.to_thread(probe_duration, path)
+    if duration is not None and duration > limits.max_duration_sec:
+        os.remove(path)
+        raise HTTPException(413, f"audio longer than {limits.max_duration_sec}s for tier {settings.app.tier}")
+
     # Start ASR processing with timing
     asr_start_time = time.time()
-    asr = ASREngine()
-    res = asr.transcribe_file(path)
+    key = cache_key(digest.hexdigest())
+    try:
+        # повторная загрузка того же аудио с теми же параметрами — без инференса
+        res = None if ASR_ENGINE.stub else await asyncio.to_thread(ASR_CACHE.get, key)
+        cache_hit = res is not None
+        if res is None:
+            res = await transcribe_path(path, duration)
+            if not ASR_ENGINE.stub:
+                try:
+                    await asyncio.to_thread(ASR_CACHE.put, key, res)
+                except OSError:
+                    logger.warning("asr cache write failed", exc_info=True)
+    except QueueFull as e:
+        raise HTTPException(503, "ASR queue is full, retry later", headers={"Retry-After": str(e.retry_after)})
+    finally:
+        os.remove(path)
     asr_duration_ms = int((time.time() - asr_start_time) * 1000)
-    os.remove(path)
+    # ASR знает точную длительность; заголовки контейнера — запасной вариант
+    audio_duration = res.duration or duration or 0.0
 
     # Log ASR processing details
     logger.info(f"ASR processing completed", extra={
@@ -60,6 +94,9 @@ async def transcribe(
         "session_id": session_id,
         "chunk_id": "media_file",
         "asr_duration_ms": asr_duration_ms,
+        "audio_duration_sec": round(audio_duration, 3),
+        "language_probability": round(res.language_probability, 3),
+        "asr_cache_hit": cache_hit,
         "file_size_bytes": size,
         "language": lang,
         "text_length": len(res.text) if res.text else 0,
@@ -67,92 +104,66 @@ async def transcribe(
     })
 
     text = res.text.strip()
-    sents = split_sentences(text)
-    chunks = make_chunks(session_id, sents, start_seq=1)  # список DTO
+    with metrics.CHUNKING.time(tier=settings.app.tier, mode="batch"):
+        sents = split_sentences(text)
+        chunks = make_chunks(session_id, sents, start_seq=1, times=sentence_times(sents, res.segments))  # список DTO
+    persist_t0 = time.perf_counter()
 
     # 1) Сохраняем сессию, финал и чанки в локальную БД
-    with get_session() as s:
-        sess = s.get(SessionModel, session_id)
+    async with get_async_session() as s:
+        sess = await s.get(SessionModel, session_id)
         if not sess:
             sess = SessionModel(id=session_id, lang=lang, tier=settings.app.tier)
             s.add(sess)
+            await s.flush()  # строка сессии нужна до пакетных INSERT (FK)
 
-        tr = TranscriptModel(
-            session_id=session_id,
-            text_full=text,
-            duration_sec=0.0,
-            total_chunks=len(chunks),
-            lang=lang,
-        )
-        s.add(tr)
+        # транскрипт и все чанки — пакетной вставкой, lang берём из запроса
+        await save_transcript(s, session_id, text, lang, chunks, duration_sec=audio_duration)
 
+        # 2) В той же транзакции ставим чанки и финал в outbox — доставкой
+        #    в Модуль 2 занимается фоновый диспетчер (подпись и Idempotency-Key — в client.py)
+        outbox = []
         for ch in chunks:
-            row = ChunkModel(
-                session_id=session_id,
-                chunk_id=ch.chunk_id,
-                seq=ch.seq,
-                text=ch.text,
-                overlap_prefix=ch.overlap_prefix,
-                lang=lang,                 # фикс: используем lang из запроса
-                policy_json=str(ch.policy),
-                hash=ch.hash,
-            )
-            s.add(row)
-
-        s.commit()
-
-    # 2) После успешного коммита: доставляем чанки в Модуль 2 (идемпотентность и подпись — внутри клиента)
-    logger.info(f"Starting chunk delivery to Mod2", extra={
-        "event": "delivery_started",
-        "session_id": session_id,
-        "total_chunks": len(chunks),
-        "service": "mod1_v2"
-    })
-    
-    for ch in chunks:
-        payload = {
-            "session_id": session_id,
-            "chunk_id": ch.chunk_id,
-            "seq": ch.seq,
-            "text": ch.text,
-            "overlap_prefix": ch.overlap_prefix,  # строка допустима по схеме
-            "lang": lang,                          # строго вида ru-RU для валидации
-        } 
-        # HMAC-SHA256 + Idempotency-Key формируются в client.py
-        await deliver_chunk(payload)
-        
-        logger.debug(f"Chunk delivered", extra={
-            "event": "chunk_delivered", 
-            "session_id": session_id,
-            "chunk_id": ch.chunk_id,
-            "seq": ch.seq,
-            "service": "mod1_v2"
-        })
+            payload = {
+                "session_id": session_id,
+                "chunk_id": ch.chunk_id,
+                "seq": ch.seq,
+                "text": ch.text,
+                "overlap_prefix": ch.overlap_prefix,  # строка допустима по схеме
+                "lang": lang,                          # строго вида ru-RU для валидации
+                "start_sec": ch.start_sec,
+                "end_sec": ch.end_sec,
+            }
+            outbox.append(("chunk", payload, f"{session_id}:{ch.chunk_id}"))
 
-    # 3) Доставляем финал
-    final_payload = {
-        "session_id": session_id,
-        "text_full": text,
-        "lang": lang,
-        "duration_sec": 0.0,           # если появится реальная длительность — подставь сюда
-        "total_chunks": len(chunks),
-    }
-    
-    logger.info(f"Delivering final result to Mod2", extra={
-        "event": "final_delivery",
+        # 3) Финал уходит после всех чанков сессии
+        final_payload = {
+            "session_id": session_id,
+            "text_full": text,
+            "lang": lang,
+            "duration_sec": audio_duration,
+            "total_chunks": len(chunks),
+        }
+        outbox.append(("final", final_payload, f"{session_id}:final"))
+        await enqueue_many(s, outbox)
+
+        await s.commit()
+    metrics.DB_PERSIST.observe(time.perf_counter() - persist_t0, tier=settings.app.tier, mode="batch")
+
+    DISPATCHER.wake()
+    logger.info(f"Chunks queued for delivery to Mod2", extra={
+        "event": "delivery_enqueued",
         "session_id": session_id,
         "total_chunks": len(chunks),
         "final_text_length": len(text),
-        "duration_sec": 0.0,
         "service": "mod1_v2"
     })
-    
-    await deliver_final(final_payload)
 
     # 4) Возвращаем результат batch-вызова как и раньше
     return BatchOut(
         session_id=session_id,
         text_full=text,
+        duration_sec=audio_duration,
         chunks=[
             {
                 "session_id": c.session_id,
@@ -164,6 +175,8 @@ async def transcribe(
                 "policy": c.policy,
                 "hash": c.hash,
                 "created_at": getattr(c, "created_at", None),  # на случай, если DTO без поля
+                "start_sec": c.start_sec,
+                "end_sec": c.end_sec,
             }
             for c in chunks
         ],
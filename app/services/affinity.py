@@ -0,0 +1,384 @@
+from __future__ import annotations
+import asyncio, hashlib, json, logging, os, socket, time
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from ..config import settings
+from ..db import async_engine
+from ..models import LiveNodeModel, LiveOwnerModel
+from .sessions import SESSION_MANAGER
+
+logger = logging.getLogger(__name__)
+
+
+def _point(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash: session_id → воркер.
+
+    У каждого воркера vnodes точек на кольце, поэтому при появлении или
+    уходе воркера переезжает примерно 1/N сессий, а не все.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 64) -> None:
+        self.vnodes = max(1, vnodes)
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self.nodes: Tuple[str, ...] = ()
+        self.set_nodes(nodes)
+
+    def set_nodes(self, nodes: Iterable[str]) -> None:
+        self.nodes = tuple(sorted(set(nodes)))
+        ring = sorted((_point(f"{node}#{i}"), node) for node in self.nodes for i in range(self.vnodes))
+        self._points = [p for p, _ in ring]
+        self._owners = [n for _, n in ring]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._points:
+            return None
+        i = bisect_right(self._points, _point(key)) % len(self._points)
+        return self._owners[i]
+
+
+class CoordinationStore(ABC):
+    """Общее для воркеров состояние: кто жив, кто владеет сессией, снимки handoff.
+
+    LocalCoordinationStore держит всё в памяти процесса (один воркер, тесты),
+    DbCoordinationStore — в общей БД сервиса. В тестах SessionAffinity
+    можно передать любую реализацию этого интерфейса.
+    """
+
+    @abstractmethod
+    async def register(self, node_id: str, url: str, ttl_sec: float) -> None:
+        ...
+
+    @abstractmethod
+    async def unregister(self, node_id: str) -> None:
+        ...
+
+    @abstractmethod
+    async def nodes(self) -> Dict[str, str]:
+        """Живые воркеры: node_id → url."""
+
+    @abstractmethod
+    async def owner(self, session_id: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def claim(self, session_id: str, node_id: str, expected: Optional[str]) -> str:
+        """Ставит владельца, если текущий равен expected (None — нет владельца); возвращает итогового."""
+
+    @abstractmethod
+    async def forget(self, session_id: str, node_id: str) -> None:
+        """Удаляет запись о сессии, только если ею владеет node_id.
+
+        Снимок handoff без владельца или сессия другого воркера не трогаются.
+        """
+
+    @abstractmethod
+    async def put_handoff(self, session_id: str, snapshot: Dict[str, Any]) -> None:
+        """Сохраняет снимок и снимает владельца — сессию подхватит следующий воркер."""
+
+    @abstractmethod
+    async def take_handoff(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Забирает снимок; второй вызов вернёт None."""
+
+
+class LocalCoordinationStore(CoordinationStore):
+    def __init__(self) -> None:
+        self._nodes: Dict[str, Tuple[str, float]] = {}
+        self._owners: Dict[str, Optional[str]] = {}
+        self._handoffs: Dict[str, Dict[str, Any]] = {}
+
+    async def register(self, node_id: str, url: str, ttl_sec: float) -> None:
+        self._nodes[node_id] = (url, time.monotonic() + ttl_sec)
+
+    async def unregister(self, node_id: str) -> None:
+        self._nodes.pop(node_id, None)
+
+    async def nodes(self) -> Dict[str, str]:
+        now = time.monotonic()
+        return {n: url for n, (url, exp) in self._nodes.items() if exp > now}
+
+    async def owner(self, session_id: str) -> Optional[str]:
+        return self._owners.get(session_id)
+
+    async def claim(self, session_id: str, node_id: str, expected: Optional[str]) -> str:
+        current = self._owners.get(session_id)
+        if current == expected:
+            self._owners[session_id] = current = node_id
+        return current or node_id
+
+    async def forget(self, session_id: str, node_id: str) -> None:
+        if self._owners.get(session_id) == node_id:
+            self._owners.pop(session_id, None)
+            self._handoffs.pop(session_id, None)
+
+    async def put_handoff(self, session_id: str, snapshot: Dict[str, Any]) -> None:
+        self._handoffs[session_id] = snapshot
+        self._owners[session_id] = None
+
+    async def take_handoff(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self._handoffs.pop(session_id, None)
+
+
+class DbCoordinationStore(CoordinationStore):
+    """Таблицы live_nodes и live_owners в БД сервиса.
+
+    Её уже делят все воркеры (sqlite-файл внутри контейнера, postgres
+    между узлами), поэтому отдельный сервис координации не нужен.
+    Смена владельца — условный UPDATE, так что два воркера не заберут
+    одну сессию.
+    """
+
+    def _insert(self, dialect: str, table: Any) -> Any:
+        if dialect == "postgresql":
+            return postgresql.insert(table)
+        if dialect == "sqlite":
+            return sqlite.insert(table)
+        return None
+
+    async def register(self, node_id: str, url: str, ttl_sec: float) -> None:
+        table = LiveNodeModel.__table__
+        expires = datetime.utcnow() + timedelta(seconds=ttl_sec)
+        async with async_engine.begin() as conn:
+            stmt = self._insert(conn.dialect.name, table)
+            if stmt is not None:
+                await conn.execute(stmt.values(id=node_id, url=url, expires_at=expires).on_conflict_do_update(
+                    index_elements=[table.c.id], set_={"url": url, "expires_at": expires}))
+                return
+            res = await conn.execute(update(table).where(table.c.id == node_id).values(url=url, expires_at=expires))
+            if not res.rowcount:
+                await conn.execute(insert(table).values(id=node_id, url=url, expires_at=expires))
+
+    async def unregister(self, node_id: str) -> None:
+        table = LiveNodeModel.__table__
+        async with async_engine.begin() as conn:
+            await conn.execute(delete(table).where(table.c.id == node_id))
+
+    async def nodes(self) -> Dict[str, str]:
+        table = LiveNodeModel.__table__
+        async with async_engine.connect() as conn:
+            rows = await conn.execute(select(table.c.id, table.c.url).where(table.c.expires_at > datetime.utcnow()))
+            return {r.id: r.url for r in rows}
+
+    async def owner(self, session_id: str) -> Optional[str]:
+        table = LiveOwnerModel.__table__
+        async with async_engine.connect() as conn:
+            return (await conn.execute(select(table.c.node_id).where(table.c.session_id == session_id))).scalar()
+
+    async def claim(self, session_id: str, node_id: str, expected: Optional[str]) -> str:
+        table = LiveOwnerModel.__table__
+        now = datetime.utcnow()
+        async with async_engine.begin() as conn:
+            if expected is None:
+                stmt = self._insert(conn.dialect.name, table)
+                if stmt is not None:
+                    await conn.execute(stmt.values(session_id=session_id, node_id=node_id, updated_at=now)
+                                       .on_conflict_do_nothing(index_elements=[table.c.session_id]))
+                cond = table.c.node_id.is_(None)
+            else:
+                cond = table.c.node_id == expected
+            await conn.execute(update(table).where(table.c.session_id == session_id, cond)
+                               .values(node_id=node_id, updated_at=now))
+            owner = (await conn.execute(select(table.c.node_id).where(table.c.session_id == session_id))).scalar()
+        return owner or node_id
+
+    async def forget(self, session_id: str, node_id: str) -> None:
+        table = LiveOwnerModel.__table__
+        async with async_engine.begin() as conn:
+            await conn.execute(delete(table).where(table.c.session_id == session_id, table.c.node_id == node_id))
+
+    async def put_handoff(self, session_id: str, snapshot: Dict[str, Any]) -> None:
+        table = LiveOwnerModel.__table__
+        data = json.dumps(snapshot, ensure_ascii=False)
+        now = datetime.utcnow()
+        async with async_engine.begin() as conn:
+            res = await conn.execute(update(table).where(table.c.session_id == session_id)
+                                     .values(node_id=None, handoff_json=data, updated_at=now))
+            if not res.rowcount:
+                await conn.execute(insert(table).values(session_id=session_id, node_id=None, handoff_json=data, updated_at=now))
+
+    async def take_handoff(self, session_id: str) -> Optional[Dict[str, Any]]:
+        table = LiveOwnerModel.__table__
+        async with async_engine.begin() as conn:
+            data = (await conn.execute(select(table.c.handoff_json).where(table.c.session_id == session_id))).scalar()
+            if data is None:
+                return None
+            res = await conn.execute(update(table)
+                                     .where(table.c.session_id == session_id, table.c.handoff_json == data)
+                                     .values(handoff_json=None))
+        # снимок успел забрать другой воркер
+        return json.loads(data) if res.rowcount else None
+
+
+class SessionAffinity:
+    """Закрепление live-сессий за воркерами.
+
+    Воркер регистрируется в CoordinationStore и продлевает регистрацию
+    heartbeat'ом; кольцо строится по живым воркерам. Владелец сессии
+    фиксируется в store при первом подключении (по кольцу) и не меняется,
+    пока он жив, — переподключения клиента не переносят LiveState. Если
+    сессия принадлежит другому воркеру, route() отдаёт его url для
+    redirect. drain() снимает воркер с кольца и передаёт открытые сессии
+    снимками через store; их подхватывает следующий владелец в adopt().
+    """
+
+    def __init__(self, store: CoordinationStore, node_id: str, url: str = "",
+                 enabled: bool = True, ttl_sec: float = 15.0, vnodes: int = 64) -> None:
+        self.store = store
+        self.node_id = node_id
+        self.url = url
+        self.enabled = enabled
+        self.ttl_sec = ttl_sec
+        self.ring = HashRing((), vnodes)
+        self.draining = False
+        self._nodes: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.redirects = 0
+        self.adopted = 0
+        self.handed_off = 0
+
+    async def start(self) -> None:
+        if not self.enabled:
+            return
+        await self._heartbeat()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.enabled:
+            await self.store.unregister(self.node_id)
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.ttl_sec / 3)
+            try:
+                await self._heartbeat()
+            except Exception:
+                logger.warning("affinity heartbeat failed", exc_info=True)
+
+    async def _heartbeat(self) -> None:
+        if not self.draining:
+            await self.store.register(self.node_id, self.url, self.ttl_sec)
+        await self.refresh()
+
+    async def refresh(self) -> None:
+        nodes = await self.store.nodes()
+        if self.draining:
+            nodes.pop(self.node_id, None)
+        if set(nodes) != set(self._nodes):
+            self.ring.set_nodes(nodes)
+        self._nodes = nodes
+
+    async def route(self, session_id: str) -> Optional[str]:
+        """None — сессию ведёт этот воркер; иначе url воркера-владельца.
+
+        Пустая строка — владелец другой, но его адрес неизвестен.
+        """
+        if not self.enabled:
+            return None
+        if self.draining:
+            if session_id in SESSION_MANAGER.states and not SESSION_MANAGER.is_detached(session_id):
+                # сессию не удалось передать — она по-прежнему здесь
+                return None
+            # воркер уходит: новые и вернувшиеся сессии — сразу следующему по кольцу
+            self.redirects += 1
+            return self._nodes.get(self.ring.owner(session_id) or "", "")
+        owner = await self.store.owner(session_id)
+        if owner is None or owner not in self._nodes:
+            # владельца нет или он выпал из кольца — назначаем по кольцу
+            target = self.ring.owner(session_id) or self.node_id
+            owner = await self.store.claim(session_id, target, owner)
+        if owner == self.node_id:
+            return None
+        self.redirects += 1
+        return self._nodes.get(owner, "")
+
+    async def adopt(self, session_id: str) -> bool:
+        """Подхватывает снимок сессии, переданной другим воркером."""
+        if not self.enabled or session_id in SESSION_MANAGER.states:
+            return False
+        snapshot = await self.store.take_handoff(session_id)
+        if snapshot is None:
+            return False
+        try:
+            await SESSION_MANAGER.adopt(session_id, snapshot)
+        except Exception:
+            # сессию здесь не подняли (например, лимит) — снимок ждёт следующей попытки
+            await self.store.put_handoff(session_id, snapshot)
+            raise
+        self.adopted += 1
+        return True
+
+    async def forget(self, session_id: str) -> None:
+        """Сессия закрыта — запись о владельце больше не нужна."""
+        if self.enabled:
+            await self.store.forget(session_id, self.node_id)
+
+    async def drain(self) -> int:
+        """Снимает воркер с кольца и передаёт открытые сессии другим."""
+        if not self.enabled:
+            return 0
+        self.draining = True
+        await self.store.unregister(self.node_id)
+        await self.refresh()
+        moved = 0
+        for state in list(SESSION_MANAGER.states.values()):
+            if state.closed:
+                continue
+            sid = state.session_id
+            target = self.ring.owner(sid)
+            try:
+                # снимок записывается в store до того, как клиенту уйдёт handoff
+                snapshot = await SESSION_MANAGER.detach(
+                    sid, partial(self.store.put_handoff, sid),
+                    url=self._nodes.get(target or "", ""), retry_url=self.url,
+                )
+                if snapshot is None:
+                    continue
+            except Exception:
+                # одна сессия не должна оставить остальные на уходящем воркере
+                logger.exception("affinity drain: handoff failed", extra={"session_id": sid})
+                continue
+            moved += 1
+        self.handed_off += moved
+        logger.info("affinity drain finished", extra={"node_id": self.node_id, "sessions": moved})
+        return moved
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "node_id": self.node_id,
+            "nodes": len(self._nodes),
+            "draining": self.draining,
+            "redirects": self.redirects,
+            "adopted": self.adopted,
+            "handed_off": self.handed_off,
+        }
+
+
+def _make_store() -> CoordinationStore:
+    if settings.app.coord_store == "local":
+        return LocalCoordinationStore()
+    return DbCoordinationStore()
+
+
+AFFINITY = SessionAffinity(
+    _make_store(),
+    settings.app.node_id or f"{socket.gethostname()}:{os.getpid()}",
+    settings.app.node_url,
+    enabled=settings.app.affinity_enabled,
+    ttl_sec=settings.app.node_ttl_sec,
+    vnodes=settings.app.ring_vnodes,
+)
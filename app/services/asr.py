@@ -1,48 +1,181 @@
 from __future__ import annotations
-from dataclasses import dataclass
+import threading, time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Iterator, List
 from ..config import settings
+from . import metrics
 
 try:
-    from faster_whisper import WhisperModel
+    from faster_whisper import WhisperModel, decode_audio
 except Exception as e:  # покажем, что именно не хватает
     print("FASTWHISPER_IMPORT_ERROR:", repr(e))
     WhisperModel = None  # type: ignore
+    decode_audio = None  # type: ignore
+
+SAMPLE_RATE = 16000
+
+
+@dataclass
+class ASRSegment:
+    start: float
+    end: float
+    text: str
 
 
 @dataclass
 class ASRResult:
     text: str
+    segments: List[ASRSegment] = field(default_factory=list)
+    language_probability: float = 0.0
+    duration: float = 0.0  # длительность аудио, сек
+
+
+class ModelPool:
+    """Общий для процесса пул загруженных WhisperModel.
+
+    Модели создаются лениво (или заранее через warmup) до `size` штук и
+    выдаются через checkout(); если свободных нет — вызывающий ждёт.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = max(1, size)
+        self._idle: List[Any] = []
+        self._created = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+
+    def _load(self) -> Any:
+        assert WhisperModel is not None, "faster-whisper is not installed"
+        return WhisperModel(
+            settings.whisper.model,
+            device=settings.whisper.device,
+            compute_type=settings.whisper.compute_type,
+        )
+
+    def _grow(self) -> None:
+        # слот уже зарезервирован через _created, грузим вне блокировки
+        try:
+            model = self._load()
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._idle.append(model)
+            self._cond.notify()
+
+    def warmup(self) -> None:
+        while True:
+            with self._cond:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+            self._grow()
+
+    @contextmanager
+    def checkout(self, timeout: float | None = None) -> Iterator[Any]:
+        grow = False
+        with self._cond:
+            if not self._idle and self._created < self.size:
+                self._created += 1
+                grow = True
+        if grow:
+            self._grow()
+        with self._cond:
+            self._waiting += 1
+            try:
+                if not self._cond.wait_for(lambda: bool(self._idle), timeout=timeout):
+                    raise TimeoutError("no free ASR model in pool")
+            finally:
+                self._waiting -= 1
+            model = self._idle.pop()
+            self._in_use += 1
+        try:
+            yield model
+        finally:
+            with self._cond:
+                self._idle.append(model)
+                self._in_use -= 1
+                self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self.size,
+                "loaded": self._created,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+            }
+
+
+MODEL_POOL = ModelPool(settings.asr.pool_size)
+
 
 class ASREngine:
-    def __init__(self) -> None:
+    def __init__(self, pool: ModelPool | None = None) -> None:
         self.stub = settings.app.stub_asr
         self.language = settings.whisper.language
-        self.model = None
+        self.pool = pool or MODEL_POOL
         if not self.stub:
             assert WhisperModel is not None, "faster-whisper is not installed"
-            self.model = WhisperModel(
-                settings.whisper.model,
-                device=settings.whisper.device,
-                compute_type=settings.whisper.compute_type,
-            )
 
-    def transcribe_file(self, path: str) -> ASRResult:
-        if self.stub:
-            text = (
-                "Здравствуйте. Это тестовая запись. Мы проверяем модуль распознавания. "
-                "Пожалуйста, разделите текст на предложения. Спасибо."
+    def warmup(self) -> None:
+        if not self.stub:
+            self.pool.warmup()
+
+    def decode(self, path: str) -> Any:
+        """Декодирует файл в float32 PCM 16 кГц моно."""
+        assert decode_audio is not None, "faster-whisper is not installed"
+        with metrics.DECODE.time(tier=settings.app.tier):
+            return decode_audio(path, sampling_rate=SAMPLE_RATE)
+
+    def _stub_result(self) -> ASRResult:
+        text = (
+            "Здравствуйте. Это тестовая запись. Мы проверяем модуль распознавания. "
+            "Пожалуйста, разделите текст на предложения. Спасибо."
+        )
+        return ASRResult(text=text)
+
+    def _run(self, audio: Any, initial_prompt: str | None = None, mode: str = "batch") -> ASRResult:
+        with self.pool.checkout(timeout=settings.asr.pool_timeout_sec) as model:
+            # только инференс: ожидание очереди, decode и VAD меряются отдельно
+            t0 = time.perf_counter()
+            segments, info = model.transcribe(
+                audio,
+                language=self.language,
+                vad_filter=settings.whisper.vad_filter,
+                temperature=settings.whisper.temperature,
+                condition_on_previous_text=True,
+                initial_prompt=initial_prompt,
             )
-            return ASRResult(text=text)
-        assert self.model is not None
-        segments, info = self.model.transcribe(
-            path,
-            language=self.language,
-            vad_filter=settings.whisper.vad_filter,
-            temperature=settings.whisper.temperature,
-            condition_on_previous_text=True,
+            out: List[ASRSegment] = []
+            # сегменты — ленивый генератор, декодирование идёт здесь, пока модель занята
+            for seg in segments:
+                out.append(ASRSegment(start=seg.start, end=seg.end, text=seg.text))
+            metrics.observe_asr(time.perf_counter() - t0, len(audio) / SAMPLE_RATE, mode)
+        text = " ".join(seg.text for seg in out).strip()
+        return ASRResult(
+            text=text,
+            segments=out,
+            language_probability=float(info.language_probability or 0.0),
+            duration=float(info.duration or 0.0),
         )
-        text_parts = []
-        for seg in segments:
-            text_parts.append(seg.text)
-        text = " ".join(text_parts).strip()
-        return ASRResult(text=text)
\ No newline at end of file
+
+    def transcribe_file(self, path: str, mode: str = "batch") -> ASRResult:
+        if self.stub:
+            return self._stub_result()
+        # декодируем сами (то же делает faster-whisper), чтобы замерить decode отдельно
+        return self._run(self.decode(path), mode=mode)
+
+    def transcribe_audio(self, audio: Any, initial_prompt: str | None = None, mode: str = "batch") -> ASRResult:
+        """Распознаёт уже декодированный PCM (numpy float32, 16 кГц)."""
+        if self.stub:
+            return self._stub_result()
+        return self._run(audio, initial_prompt=initial_prompt, mode=mode)
+
+
+ASR_ENGINE = ASREngine()
@@ -0,0 +1,165 @@
+from __future__ import annotations
+import hashlib, json, os, tempfile, threading
+from collections import OrderedDict
+from dataclasses import asdict
+from typing import Any, Dict, Optional
+from ..config import settings
+from .asr import ASRResult, ASRSegment
+
+# меняется при несовместимом изменении формата записи
+CACHE_VERSION = 2
+
+
+def cache_key(audio_sha256: str) -> str:
+    """Ключ результата: хэш аудио + параметры, влияющие на распознавание."""
+    w = settings.whisper
+    raw = f"v{CACHE_VERSION}|{audio_sha256}|{w.model}|{w.language}|{w.vad_filter}|{w.temperature}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _dump(result: ASRResult) -> bytes:
+    return json.dumps(asdict(result), ensure_ascii=False).encode("utf-8")
+
+
+def _load(data: bytes) -> ASRResult:
+    d: Dict[str, Any] = json.loads(data)
+    d["segments"] = [ASRSegment(**s) for s in d.get("segments", [])]
+    return ASRResult(**d)
+
+
+class ASRResultCache:
+    """LRU результатов распознавания: в памяти и на диске.
+
+    Память — OrderedDict на mem_items записей. Диск — по файлу на ключ в
+    cache_dir; при превышении disk_mb удаляются файлы с самым старым mtime
+    (попадание обновляет mtime). disk_mb=0 отключает диск.
+    """
+
+    def __init__(self, mem_items: int, cache_dir: str, disk_mb: int) -> None:
+        self.mem_items = max(0, mem_items)
+        self.cache_dir = cache_dir
+        self.disk_bytes_max = max(0, disk_mb) * 1024 * 1024
+        self._mem: "OrderedDict[str, ASRResult]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes: Optional[int] = None  # считаем при первом обращении
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def _remember(self, key: str, result: ASRResult) -> None:
+        if not self.mem_items:
+            return
+        self._mem[key] = result
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.mem_items:
+            self._mem.popitem(last=False)
+
+    def get(self, key: str) -> Optional[ASRResult]:
+        with self._lock:
+            result = self._mem.get(key)
+            if result is not None:
+                self._mem.move_to_end(key)
+                self.hits_memory += 1
+                return result
+        if self.disk_bytes_max:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    result = _load(f.read())
+                os.utime(path)
+            except FileNotFoundError:
+                result = None
+            except Exception:
+                # повреждённая запись — считаем промахом, перезапишется при put
+                result = None
+            if result is not None:
+                with self._lock:
+                    self.hits_disk += 1
+                    self._remember(key, result)
+                return result
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, result: ASRResult) -> None:
+        with self._lock:
+            self._remember(key, result)
+            self.stores += 1
+        if not self.disk_bytes_max:
+            return
+        data = _dump(result)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # уникальное имя: put() зовут параллельно из потоков и процессов
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".tmp", delete=False) as f:
+            f.write(data)
+        try:
+            os.replace(f.name, path)
+        except OSError:
+            os.remove(f.name)
+            raise
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan()[1]
+            else:
+                self._disk_bytes += len(data)
+            if self._disk_bytes > self.disk_bytes_max:
+                self._evict_disk()
+
+    def _scan(self) -> tuple[list[tuple[float, int, str]], int]:
+        files = []
+        total = 0
+        for root, _dirs, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                p = os.path.join(root, name)
+                try:
+                    st = os.stat(p)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, p))
+                total += st.st_size
+        return files, total
+
+    def _evict_disk(self) -> None:
+        # освобождаем до 90% лимита, чтобы не сканировать каталог на каждой записи
+        files, total = self._scan()
+        files.sort()
+        target = int(self.disk_bytes_max * 0.9)
+        for _mtime, size, p in files:
+            if total <= target:
+                break
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+        self._disk_bytes = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits_memory + self.hits_disk + self.misses
+            return {
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits_memory + self.hits_disk) / lookups, 3) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "memory_items": len(self._mem),
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+ASR_CACHE = ASRResultCache(
+    settings.asr.cache_mem_items,
+    settings.asr.cache_dir,
+    settings.asr.cache_disk_mb,
+)
@@ -0,0 +1,176 @@
+from __future__ import annotations
+import asyncio, threading
+from typing import Optional, Tuple
+import numpy as np
+from ..config import settings
+from .asr import SAMPLE_RATE
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """Длительность по заголовкам контейнера без декодирования аудио.
+
+    None — длительность неизвестна (например, webm из MediaRecorder без
+    Duration) или файл не читается; такие файлы не отклоняются заранее.
+    """
+    try:
+        import av
+        with av.open(path) as container:
+            if container.duration:
+                return container.duration / av.time_base
+            for stream in container.streams.audio:
+                if stream.duration and stream.time_base:
+                    return float(stream.duration * stream.time_base)
+    except Exception:
+        return None
+    return None
+
+
+class PCMRingBuffer:
+    """Буфер декодированного PCM (float32, 16 кГц) для live-сессии.
+
+    Адресация абсолютная: позиция N — это N-й сэмпл с начала сессии.
+    view() отдаёт срез без копирования. Прочитанное и зафиксированное
+    аудио отмечается через release(); при нехватке места хвост
+    переносится в новый массив, поэтому уже выданные view не меняются
+    под читателем. Если места нет даже после release, самые старые
+    сэмплы отбрасываются (см. dropped). Пишет цикл событий, читает поток
+    ASR — состояние меняется только под блокировкой, а window() отдаёт
+    позицию и срез согласованно.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(SAMPLE_RATE, capacity)
+        self._buf = np.empty(self.capacity, dtype=np.float32)
+        self._start = 0      # абсолютная позиция _buf[0]
+        self._len = 0
+        self._released = 0   # абсолютная позиция, до которой данные не нужны
+        self.dropped = 0
+        # write() идёт из цикла событий, view()/release() — из потока ASR
+        self._lock = threading.Lock()
+
+    @property
+    def start(self) -> int:
+        with self._lock:
+            return self._start
+
+    @property
+    def end(self) -> int:
+        with self._lock:
+            return self._start + self._len
+
+    def write(self, pcm: np.ndarray) -> None:
+        n = len(pcm)
+        if n == 0:
+            return
+        with self._lock:
+            self._write(pcm, n)
+
+    def _write(self, pcm: np.ndarray, n: int) -> None:
+        if n > self.capacity:
+            self.dropped += n - self.capacity
+            self._start += n - self.capacity
+            pcm = pcm[-self.capacity:]
+            n = self.capacity
+        if self._len + n > self.capacity:
+            self._compact(n)
+        self._buf[self._len:self._len + n] = pcm
+        self._len += n
+
+    def _compact(self, need: int) -> None:
+        keep_from = max(self._released, self._start) - self._start
+        overflow = (self._len - keep_from) + need - self.capacity
+        if overflow > 0:
+            self.dropped += overflow
+            keep_from += overflow
+        buf = np.empty(self.capacity, dtype=np.float32)
+        kept = self._len - keep_from
+        buf[:kept] = self._buf[keep_from:self._len]
+        self._buf = buf
+        self._start += keep_from
+        self._len = kept
+
+    def seek(self, pos: int) -> None:
+        """Пустой буфер начинается с абсолютной позиции pos (сессия, принятая у другого воркера)."""
+        with self._lock:
+            assert self._len == 0, "seek on a non-empty buffer"
+            self._start = self._released = pos
+
+    def window(self, start: int = 0) -> Tuple[int, np.ndarray]:
+        """(абсолютная позиция первого сэмпла, срез) — согласованно под блокировкой."""
+        with self._lock:
+            lo = max(start, self._start)
+            return lo, self._buf[lo - self._start:self._len]
+
+    def view(self, start: int = 0) -> np.ndarray:
+        return self.window(start)[1]
+
+    def release(self, upto: int) -> None:
+        with self._lock:
+            self._released = max(self._released, upto)
+
+
+class StreamDecoder:
+    """Инкрементальный декодер webm/ogg → PCM через процесс ffmpeg.
+
+    Байты из WebSocket пишутся в stdin, PCM читается из stdout
+    фоновой задачей и дописывается в PCMRingBuffer.
+    """
+
+    def __init__(self, sink: PCMRingBuffer) -> None:
+        self.sink = sink
+        self._proc: asyncio.subprocess.Process | None = None
+        self._reader: asyncio.Task | None = None
+
+    @property
+    def started(self) -> bool:
+        return self._proc is not None
+
+    async def start(self) -> None:
+        self._proc = await asyncio.create_subprocess_exec(
+            settings.asr.ffmpeg_bin,
+            "-hide_banner", "-loglevel", "error", "-nostdin",
+            "-fflags", "nobuffer", "-probesize", "32768", "-analyzeduration", "0",
+            "-i", "pipe:0",
+            "-f", "f32le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self._reader = asyncio.create_task(self._read(self._proc))
+
+    async def _read(self, proc: asyncio.subprocess.Process) -> None:
+        assert proc.stdout is not None
+        rest = b""
+        while True:
+            data = await proc.stdout.read(64 * 1024)
+            if not data:
+                break
+            data = rest + data
+            cut = len(data) - len(data) % 4
+            rest = data[cut:]
+            if cut:
+                self.sink.write(np.frombuffer(data[:cut], dtype=np.float32))
+
+    async def feed(self, data: bytes) -> None:
+        if self._proc is None:
+            await self.start()
+        assert self._proc is not None and self._proc.stdin is not None
+        try:
+            self._proc.stdin.write(data)
+            await self._proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg завершился на битых данных — остаток потока теряем
+            pass
+
+    async def close(self) -> None:
+        """Закрывает stdin и дожидается, пока ffmpeg отдаст остаток PCM."""
+        if self._proc is None:
+            return
+        proc, self._proc = self._proc, None
+        if proc.stdin is not None and not proc.stdin.is_closing():
+            proc.stdin.close()
+        try:
+            if self._reader is not None:
+                await self._reader
+        finally:
+            await proc.wait()
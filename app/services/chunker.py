@@ -1,11 +1,26 @@
 from __future__ import annotations
 import re, hashlib, uuid
-from typing import List
+from bisect import bisect_right
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
 from dataclasses import dataclass
 from ..config import settings
 
-# Простая ру сегментация предложений
-SENT_RX = re.compile(r"\s*(.+?)([.!?…]+)(?=\s+[A-ZА-ЯЁ]|$)")
+# Простая ру сегментация предложений: граница — серия [.!?…] (многоточие
+# считается одной серией), за которой пробел и заглавная буква или конец текста
+BOUNDARY_RX = re.compile(r"[.!?…]+(?= [A-ZА-ЯЁ]|$)")
+
+# после этих сокращений точка не завершает предложение, даже перед заглавной
+# («г. Москва», «ул. Ленина»). Сокращения, которыми предложение часто
+# заканчивается («и т. д.», «5 тыс.», «10 см.», «на стр.»), сюда не входят
+ABBREVIATIONS = frozenset({
+    "г", "ул", "пр", "пер", "просп", "пл", "наб", "обл", "им",
+    "св", "проф", "акад", "доц", "канд", "чл", "корр", "ген", "полк",
+    "ср", "напр", "англ", "лат", "нем", "фр", "т.е", "т.к", "т.н", "т.ч",
+})
+
+# типичная фамилия (с падежным окончанием): «А. Пушкин», «Б. Иванову»,
+# но не «план Б. Он сказал»
+SURNAME_RX = re.compile(r"[А-ЯЁ][а-яё]*(?:(?:ов|ев|ёв|ин|ын|ск|цк)[а-яё]{0,3}|ко|ук|юк|их|ых|ян|дзе|швили)$")
 
 @dataclass
 class ChunkPolicy:
@@ -13,22 +28,57 @@ class ChunkPolicy:
     sent_max: int
     char_limit: int
     overlap_sent: int
+    sentence_max_chars: int
 
 policy = ChunkPolicy(
     settings.chunking.sent_min,
     settings.chunking.sent_max,
     settings.chunking.char_limit,
     settings.chunking.overlap_sent,
+    settings.chunking.sentence_max_chars,
 )
 
+# один объект на все чанки: store.py сериализует его в policy_json один раз
+POLICY = {"sentences_per_chunk": [policy.sent_min, policy.sent_max], "char_limit": policy.char_limit, "overlap_sentences": policy.overlap_sent}
+
+def _is_initial(word: str) -> bool:
+    return len(word) == 2 and word[0].isupper() and word[1] == "."
+
+def _is_abbreviation(text: str, p: int, q: int) -> bool:
+    """Одиночная точка в text[p:q] стоит после сокращения или инициала."""
+    if q - p != 1 or text[p] != ".":
+        return False
+    ws = text.rfind(" ", 0, p)
+    word = text[ws + 1:p].lstrip("(«\"'")
+    if len(word) == 1 and word.isupper():
+        # инициал — только если за ним ещё инициал или фамилия:
+        # «А. С. Пушкин», «А. Пушкин»; «Ответ — Я. Потом» — граница
+        end = text.find(" ", q + 1)
+        nxt = text[q + 1:end if end >= 0 else len(text)]
+        return _is_initial(nxt) or SURNAME_RX.match(nxt.rstrip(",.;:!?…»)\"'")) is not None
+    if word == "г" and ws > 0 and text[ws - 1].isdigit():
+        return False  # «в 2020 г. Потом» — год в конце предложения
+    return word.lower() in ABBREVIATIONS
+
 def split_sentences(text: str) -> List[str]:
-    text = re.sub(r"\s+", " ", text.strip())
+    """Один проход по тексту: время линейно от длины, без бэктрекинга.
+
+    Совпадает с прежним разбором на SENT_RX, кроме точек после сокращений
+    и инициалов, которые больше не режут предложение.
+    """
+    text = " ".join(text.split())
     out: List[str] = []
     i = 0
-    for m in SENT_RX.finditer(text):
-        sent = (m.group(1) + m.group(2)).strip()
-        out.append(sent)
-        i = m.end()
+    for m in BOUNDARY_RX.finditer(text):
+        p, q = m.span()
+        start = i + 1 if i < len(text) and text[i] == " " else i
+        # предложение не может состоять из одной точки: «. Дальше» идёт в следующее
+        if p == start and q - p < 2:
+            continue
+        if _is_abbreviation(text, p, q):
+            continue
+        out.append(text[start:q])
+        i = q
     tail = text[i:].strip()
     if tail:
         out.append(tail)
@@ -45,50 +95,242 @@ class ChunkDTO:
     policy: dict
     hash: str
     created_at: str = ""
+    start_sec: Optional[float] = None
+    end_sec: Optional[float] = None
+
+def sentence_times(sentences: Sequence[str], segments: Sequence[Any]) -> List[Tuple[float, float]]:
+    """Таймкоды предложений по сегментам ASR (объекты со start/end/text).
+
+    Предложения и сегменты — разбиение одного и того же текста, поэтому
+    сопоставляем их по позиции символа в тексте с нормализованными пробелами.
+    """
+    seg_pos: List[int] = []
+    segs: List[Any] = []
+    pos = 0
+    for seg in segments:
+        t = " ".join(seg.text.split())
+        if not t:
+            continue
+        seg_pos.append(pos)
+        segs.append(seg)
+        pos += len(t) + 1
+    if not segs:
+        return []
+    out: List[Tuple[float, float]] = []
+    pos = 0
+    for sent in sentences:
+        first = segs[max(0, bisect_right(seg_pos, pos) - 1)]
+        last = segs[max(0, bisect_right(seg_pos, pos + max(0, len(sent) - 1)) - 1)]
+        out.append((first.start, last.end))
+        pos += len(sent) + 1
+    return out
 
 def _hash(session_id: str, seq: int, text: str) -> str:
     h = hashlib.sha256()
     h.update(f"{session_id}|{seq}|{text}".encode("utf-8"))
     return h.hexdigest()
 
-def make_chunks(session_id: str, sentences: List[str], start_seq: int = 1) -> List[ChunkDTO]:
+# пространство имён uuid5 для chunk_id; не менять — от него зависит дедупликация в Mod2
+CHUNK_NAMESPACE = uuid.UUID("1583db12-1a1e-5702-821b-21b49578d653")
+
+def chunk_uuid(session_id: str, seq: int, hash: str) -> str:
+    """chunk_id выводится из содержимого: повторная обработка того же аудио
+    даёт те же id, и Idempotency-Key session_id:chunk_id совпадает."""
+    return str(uuid.uuid5(CHUNK_NAMESPACE, f"{session_id}|{seq}|{hash}"))
+
+def make_chunks(
+    session_id: str,
+    sentences: List[str],
+    start_seq: int = 1,
+    times: Optional[Sequence[Tuple[float, float]]] = None,
+) -> List[ChunkDTO]:
+    """times — таймкоды предложений (см. sentence_times), если известны.
+
+    Буфер копится через StreamingChunker.add_sentence с нарастающим счётчиком
+    символов, так что текст чанка собирается один раз, а не на каждом шаге.
+    """
+    chunker = StreamingChunker(session_id, start_seq=start_seq)
     chunks: List[ChunkDTO] = []
-    buf: List[str] = []
-    seq = start_seq
-    overlap_prev = ""
-    idx = 0
-    while idx < len(sentences):
-        buf.append(sentences[idx])
-        cur_txt = " ".join(buf)
-        if (len(buf) >= policy.sent_min and (len(buf) >= policy.sent_max or len(cur_txt) >= policy.char_limit)):
-            text = cur_txt
-            overlap_prefix = overlap_prev
-            dto = ChunkDTO(
-                session_id=session_id,
-                chunk_id=str(uuid.uuid4()),
-                seq=seq,
-                text=text,
-                overlap_prefix=overlap_prefix,
-                lang="ru-RU",
-                policy={"sentences_per_chunk": [policy.sent_min, policy.sent_max], "char_limit": policy.char_limit, "overlap_sentences": policy.overlap_sent},
-                hash=_hash(session_id, seq, text),
-            )
-            chunks.append(dto)
-            overlap_prev = buf[-1] if policy.overlap_sent > 0 else ""
-            buf = []
-            seq += 1
-        idx += 1
-    if buf:
-        text = " ".join(buf)
+    for idx, sent in enumerate(sentences):
+        chunk = chunker.add_sentence(sent, times[idx] if times and idx < len(times) else None)
+        if chunk is not None:
+            chunks.append(chunk)
+    chunks.extend(chunker.flush())
+    return chunks
+
+
+class _Seg(NamedTuple):
+    start: float
+    end: float
+    text: str
+
+class StreamingChunker:
+    """Чанкер live-сессии: принимает дописываемый текст и выдаёт готовые чанки.
+
+    Последнее предложение остаётся незавершённым, пока не придёт следующий
+    текст (граница определяется по тому, что идёт после точки) или flush().
+    Чанк выдаётся, как только набраны sent_min/sent_max/char_limit; буфер,
+    overlap и таймкоды сегментов хранятся внутри, поэтому стоимость feed()
+    зависит только от нового текста, а границы — только от самого текста,
+    а не от того, какими порциями он пришёл.
+    """
+
+    def __init__(self, session_id: str, lang: str = "ru-RU", start_seq: int = 1) -> None:
+        self.session_id = session_id
+        self.lang = lang
+        self.next_seq = start_seq
+        self.sentences = 0           # сколько предложений уже легло в чанки/буфер
+        self._pending = ""           # хвост текста после последней известной границы
+        self._pending_pos = 0        # позиция _pending в нормализованном тексте сессии
+        self._text_len = 0           # длина всего нормализованного текста сессии
+        self._seg_pos: List[int] = []
+        self._segs: List[Any] = []
+        self._buf: List[str] = []
+        self._buf_chars = 0
+        self._buf_start: Optional[float] = None
+        self._buf_end: Optional[float] = None
+        self._overlap = ""
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Состояние в JSON-совместимом виде — для передачи сессии другому воркеру."""
+        return {
+            "lang": self.lang,
+            "next_seq": self.next_seq,
+            "sentences": self.sentences,
+            "pending": self._pending,
+            "pending_pos": self._pending_pos,
+            "text_len": self._text_len,
+            "segments": [[p, seg.start, seg.end, seg.text] for p, seg in zip(self._seg_pos, self._segs)],
+            "buf": list(self._buf),
+            "buf_start": self._buf_start,
+            "buf_end": self._buf_end,
+            "overlap": self._overlap,
+        }
+
+    @classmethod
+    def from_snapshot(cls, session_id: str, data: Dict[str, Any]) -> "StreamingChunker":
+        ch = cls(session_id, data.get("lang", "ru-RU"), data.get("next_seq", 1))
+        ch.sentences = data.get("sentences", 0)
+        ch._pending = data.get("pending", "")
+        ch._pending_pos = data.get("pending_pos", 0)
+        ch._text_len = data.get("text_len", 0)
+        for p, start, end, text in data.get("segments", []):
+            ch._seg_pos.append(p)
+            ch._segs.append(_Seg(start, end, text))
+        ch._buf = list(data.get("buf", []))
+        ch._buf_chars = sum(len(x) for x in ch._buf) + max(0, len(ch._buf) - 1)
+        ch._buf_start = data.get("buf_start")
+        ch._buf_end = data.get("buf_end")
+        ch._overlap = data.get("overlap", "")
+        return ch
+
+    def _time_at(self, pos: int) -> Optional[Any]:
+        i = bisect_right(self._seg_pos, pos) - 1
+        return self._segs[max(0, i)] if self._segs else None
+
+    def _forget_segments(self, upto: int) -> None:
+        # сегменты целиком до upto больше не понадобятся
+        i = bisect_right(self._seg_pos, upto) - 1
+        if i > 0:
+            del self._seg_pos[:i]
+            del self._segs[:i]
+
+    def feed(self, text: str, segments: Sequence[Any] = ()) -> List[ChunkDTO]:
+        """Добавляет текст (и его сегменты ASR со start/end/text).
+
+        Незавершённый хвост не длиннее sentence_max_chars: без пунктуации он
+        режется по последнему пробелу до лимита, иначе каждый вызов заново
+        разбирал бы всё, что сказано с последней точки.
+        """
+        norm = " ".join(text.split())
+        if not norm:
+            return []
+        base = self._text_len + 1 if self._text_len else 0
+        pos = base
+        for seg in segments:
+            t = " ".join(seg.text.split())
+            if not t:
+                continue
+            self._seg_pos.append(pos)
+            self._segs.append(seg)
+            pos += len(t) + 1
+        self._text_len = base + len(norm)
+        if self._pending:
+            self._pending = f"{self._pending} {norm}"
+        else:
+            self._pending = norm
+            self._pending_pos = base
+        sents = split_sentences(self._pending)
+        # последнее предложение ждёт продолжения текста
+        tail = sents.pop() if sents else ""
+        limit = policy.sentence_max_chars
+        while len(tail) > limit:
+            cut = tail.rfind(" ", 0, limit + 1)
+            if cut <= 0:
+                cut = tail.find(" ", limit)
+            if cut <= 0:
+                break  # одно слово длиннее лимита — ждём пробела
+            sents.append(tail[:cut])
+            tail = tail[cut + 1:]
+        out = self._consume(sents)
+        self._pending = tail
+        return out
+
+    def flush(self) -> List[ChunkDTO]:
+        """Конец сессии: дописывает хвост и отдаёт неполный буфер чанком."""
+        out = self._consume(split_sentences(self._pending)) if self._pending else []
+        self._pending = ""
+        if self._buf:
+            out.append(self._emit())
+        return out
+
+    def _consume(self, sents: Sequence[str]) -> List[ChunkDTO]:
+        out: List[ChunkDTO] = []
+        pos = self._pending_pos
+        for sent in sents:
+            first = self._time_at(pos)
+            last = self._time_at(pos + max(0, len(sent) - 1))
+            chunk = self.add_sentence(sent, (first.start, last.end) if first and last else None)
+            if chunk is not None:
+                out.append(chunk)
+            pos += len(sent) + 1
+        if sents:
+            self._pending_pos = pos
+            self._forget_segments(pos)
+        return out
+
+    def add_sentence(self, sentence: str, span: Optional[Tuple[float, float]] = None) -> Optional[ChunkDTO]:
+        """Кладёт готовое предложение в буфер; возвращает чанк, если политика выполнена."""
+        self.sentences += 1
+        if not self._buf:
+            self._buf_start = span[0] if span else None
+        self._buf_end = span[1] if span else None
+        self._buf_chars += len(sentence) + (1 if self._buf else 0)
+        self._buf.append(sentence)
+        n = len(self._buf)
+        if n >= policy.sent_min and (n >= policy.sent_max or self._buf_chars >= policy.char_limit):
+            return self._emit()
+        return None
+
+    def _emit(self) -> ChunkDTO:
+        text = " ".join(self._buf)
+        seq = self.next_seq
+        digest = _hash(self.session_id, seq, text)
         dto = ChunkDTO(
-            session_id=session_id,
-            chunk_id=str(uuid.uuid4()),
+            session_id=self.session_id,
+            chunk_id=chunk_uuid(self.session_id, seq, digest),
             seq=seq,
             text=text,
-            overlap_prefix=overlap_prev,
-            lang="ru-RU",
-            policy={"sentences_per_chunk": [policy.sent_min, policy.sent_max], "char_limit": policy.char_limit, "overlap_sentences": policy.overlap_sent},
-            hash=_hash(session_id, seq, text),
+            overlap_prefix=self._overlap,
+            lang=self.lang,
+            policy=POLICY,
+            hash=digest,
+            start_sec=self._buf_start,
+            end_sec=self._buf_end,
         )
-        chunks.append(dto)
-    return chunks
\ No newline at end of file
+        self._overlap = self._buf[-1] if policy.overlap_sent > 0 else ""
+        self._buf = []
+        self._buf_chars = 0
+        self._buf_start = self._buf_end = None
+        self.next_seq += 1
+        return dto
@@ -0,0 +1,103 @@
+from __future__ import annotations
+import asyncio
+from typing import Any, List, Optional, Tuple
+from ..config import settings
+from .asr import ASR_ENGINE, ASRResult, ASRSegment, SAMPLE_RATE
+from .workers import ASR_EXECUTOR, QueueFull
+
+try:
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+except Exception:  # без faster-whisper длинные файлы идут обычным путём
+    VadOptions = None  # type: ignore
+    get_speech_timestamps = None  # type: ignore
+
+Span = Tuple[int, int]  # [start, end) в сэмплах
+
+
+def plan_spans(audio: Any, max_sec: float, min_silence_ms: int) -> List[Span]:
+    """Режет аудио по паузам VAD на куски не длиннее max_sec.
+
+    Соседние участки речи склеиваются, пока кусок укладывается в лимит;
+    тишина между кусками не распознаётся вовсе.
+    """
+    assert get_speech_timestamps is not None, "faster-whisper is not installed"
+    speech = get_speech_timestamps(audio, VadOptions(
+        min_silence_duration_ms=min_silence_ms,
+        max_speech_duration_s=max_sec,
+        speech_pad_ms=200,
+    ))
+    max_len = int(max_sec * SAMPLE_RATE)
+    spans: List[Span] = []
+    for ts in speech:
+        if spans and ts["end"] - spans[-1][0] <= max_len:
+            spans[-1] = (spans[-1][0], ts["end"])
+        else:
+            spans.append((ts["start"], ts["end"]))
+    out: List[Span] = []
+    for a, b in spans:
+        # страховка: VAD не нашёл паузы внутри слишком длинной речи
+        while b - a > max_len:
+            out.append((a, a + max_len))
+            a += max_len
+        out.append((a, b))
+    return out
+
+
+def _decode_and_plan(path: str) -> Tuple[Any, List[Span]]:
+    audio = ASR_ENGINE.decode(path)
+    if len(audio) < settings.asr.long_file_min_sec * SAMPLE_RATE:
+        return audio, [(0, len(audio))]
+    return audio, plan_spans(audio, settings.asr.long_segment_sec, settings.asr.long_min_silence_ms)
+
+
+async def _run_span(audio: Any, span: Span, slots: asyncio.Semaphore) -> ASRResult:
+    async with slots:
+        while True:
+            try:
+                return await ASR_EXECUTOR.run(ASR_ENGINE.transcribe_audio, audio[span[0]:span[1]])
+            except QueueFull as e:
+                # файл уже принят в работу — ждём место, а не бросаем готовые куски
+                await asyncio.sleep(e.retry_after)
+
+
+def stitch(spans: List[Span], parts: List[ASRResult], duration: float) -> ASRResult:
+    segments: List[ASRSegment] = []
+    weighted = 0.0
+    speech = 0
+    for (start, end), part in zip(spans, parts):
+        offset = start / SAMPLE_RATE
+        for seg in part.segments:
+            segments.append(ASRSegment(start=seg.start + offset, end=seg.end + offset, text=seg.text))
+        weighted += part.language_probability * (end - start)
+        speech += end - start
+    text = " ".join(p.text.strip() for p in parts if p.text.strip())
+    return ASRResult(
+        text=text,
+        segments=segments,
+        language_probability=weighted / speech if speech else 0.0,
+        duration=duration,
+    )
+
+
+async def transcribe_path(path: str, duration: Optional[float] = None) -> ASRResult:
+    """Распознаёт загруженный файл; длинные — параллельно по кускам.
+
+    Файлы короче asr.long_file_min_sec (или при одном воркере) идут
+    прежним путём через transcribe_file. Длинные декодируются один раз,
+    режутся plan_spans и распознаются до asr.workers кусков одновременно
+    на моделях общего ModelPool; результат склеивается по порядку со
+    сдвигом таймкодов.
+    """
+    short = duration is not None and duration < settings.asr.long_file_min_sec
+    if ASR_ENGINE.stub or ASR_EXECUTOR.workers < 2 or short or get_speech_timestamps is None:
+        return await ASR_EXECUTOR.run(ASR_ENGINE.transcribe_file, path)
+    audio, spans = await ASR_EXECUTOR.run(_decode_and_plan, path)
+    total = len(audio) / SAMPLE_RATE
+    if not spans:
+        return ASRResult(text="", duration=total)
+    if len(spans) == 1:
+        a, b = spans[0]
+        return stitch(spans, [await ASR_EXECUTOR.run(ASR_ENGINE.transcribe_audio, audio[a:b])], total)
+    slots = asyncio.Semaphore(ASR_EXECUTOR.workers)
+    parts = await asyncio.gather(*(_run_span(audio, span, slots) for span in spans))
+    return stitch(spans, list(parts), total)
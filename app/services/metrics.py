@@ -0,0 +1,173 @@
+from __future__ import annotations
+import math, threading, time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+from ..config import settings
+
+LabelValues = Tuple[str, ...]
+
+# секунды: от быстрых запросов к БД до распознавания часовых файлов
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5)
+
+
+def _fmt(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v))
+
+
+def _labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.label_names, k)} {_fmt(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Значение снимается функцией в момент запроса /metrics."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Dict[LabelValues, float]], labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._fn = fn
+
+    def render(self) -> List[str]:
+        return self.header() + [f"{self.name}{_labels(self.label_names, k)} {_fmt(v)}" for k, v in self._fn().items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[LabelValues, List[float]] = {}  # счётчики бакетов + sum + count
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+                    break
+            s[-2] += value
+            s[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        out = self.header()
+        for key, s in items:
+            acc = 0.0
+            for i, b in enumerate(self.buckets):
+                acc += s[i]
+                le = 'le="%s"' % _fmt(b)
+                out.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {_fmt(acc)}")
+            out.append(f"{self.name}_sum{_labels(self.label_names, key)} {_fmt(s[-2])}")
+            out.append(f"{self.name}_count{_labels(self.label_names, key)} {_fmt(s[-1])}")
+        return out
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render() -> str:
+    lines: List[str] = []
+    for m in REGISTRY:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+def base_labels() -> Dict[str, str]:
+    return {"tier": settings.app.tier, "model": settings.whisper.model}
+
+
+UPLOAD_RECEIVE = Histogram("mod1_upload_receive_seconds", "Time to receive the /v1/transcribe request body", ["tier"])
+DECODE = Histogram("mod1_decode_seconds", "Audio file decode time", ["tier"])
+ASR = Histogram("mod1_asr_seconds", "ASR inference time per call", ["tier", "model", "mode"])
+CHUNKING = Histogram("mod1_chunking_seconds", "Sentence split and chunk build time", ["tier", "mode"])
+DB_PERSIST = Histogram("mod1_db_persist_seconds", "Time to persist transcripts and chunks", ["tier", "mode"])
+CHUNK_DELIVERY = Histogram("mod1_chunk_delivery_seconds", "Per-chunk delivery latency to Mod2", ["path"])
+RTF = Histogram("mod1_asr_rtf", "Real-time factor per ASR call (processing / audio seconds)", ["tier", "model", "mode"], RTF_BUCKETS)
+ASR_AUDIO_SECONDS = Counter("mod1_asr_audio_seconds_total", "Audio seconds processed by ASR", ["tier", "model", "mode"])
+LIVE_CHUNK_FALLBACK = Counter("mod1_live_chunk_fallback_total", "Live chunks queued to the outbox after a failed webhook send (or behind one)", ["reason"])
+SESSION_EVICTIONS = Counter("mod1_live_session_evictions_total", "LiveState entries closed or dropped by the janitor", ["reason"])
+ASR_PROCESSING_SECONDS = Counter("mod1_asr_processing_seconds_total", "Wall seconds spent in ASR", ["tier", "model", "mode"])
+
+
+def _rtf_total() -> Dict[LabelValues, float]:
+    out: Dict[LabelValues, float] = {}
+    with ASR_AUDIO_SECONDS._lock:
+        audio = dict(ASR_AUDIO_SECONDS._values)
+    for key, sec in audio.items():
+        if sec > 0:
+            out[key] = ASR_PROCESSING_SECONDS.value(**dict(zip(ASR_AUDIO_SECONDS.label_names, key))) / sec
+    return out
+
+
+Gauge("mod1_asr_rtf_cumulative", "Processing seconds / audio seconds since start", _rtf_total, ["tier", "model", "mode"])
+
+
+def observe_asr(seconds: float, audio_sec: float, mode: str) -> None:
+    labels = {**base_labels(), "mode": mode}
+    ASR.observe(seconds, **labels)
+    ASR_PROCESSING_SECONDS.inc(seconds, **labels)
+    if audio_sec > 0:
+        ASR_AUDIO_SECONDS.inc(audio_sec, **labels)
+        RTF.observe(seconds / audio_sec, **labels)
@@ -1,16 +1,44 @@
 from __future__ import annotations
-import asyncio, time, os
+import asyncio, time, os, logging
 from dataclasses import dataclass, field
-from typing import Dict
+from typing import Any, Awaitable, Callable, Dict, IO, List, Optional, Tuple
 from datetime import datetime
 from sqlmodel import select
+from sqlalchemy import update, bindparam
 
 from ..config import settings
-from ..db import get_session
-from ..models import SessionModel, TranscriptModel, ChunkModel
-from .asr import ASREngine
-from .chunker import split_sentences, make_chunks
+from ..db import get_async_session, async_engine
+from ..models import SessionModel, ChunkModel
+from .asr import ASR_ENGINE, ASRSegment, SAMPLE_RATE
+from .audio import PCMRingBuffer, StreamDecoder
+from .workers import ASR_EXECUTOR, QueueFull
+from .streaming_asr import StreamingTranscriber
+from .chunker import ChunkDTO, StreamingChunker, split_sentences, sentence_times
+from .store import insert_chunks, upsert_transcript
+from . import metrics
 from .webhooks import get_active_webhook, send_chunk
+from ..delivery.breaker import CircuitOpen
+from ..delivery.outbox import enqueue_many, DISPATCHER
+
+logger = logging.getLogger(__name__)
+
+
+class SessionLimitExceeded(Exception):
+    """Открытых live-сессий уже max_live_sessions."""
+
+
+class SessionClosed(Exception):
+    """Сессия уже закрыта в БД: новое аудио перезаписало бы её чанки."""
+
+
+class SessionDetached(Exception):
+    """Сессия передана другому воркеру (drain); клиент получит redirect."""
+
+# сырое аудио live-сессий (без streaming — и для распознавания целиком)
+TMP_DIR = "/app/tmp"
+
+# подписчик live-событий сессии (partial/chunk); вызывается из цикла событий и не должен блокировать
+Listener = Callable[[Dict[str, Any]], None]
 
 @dataclass
 class LiveState:
@@ -18,123 +46,593 @@ class LiveState:
     tmp_path: str
     last_debounce: float = 0.0
     lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    # отдельная блокировка обработки, чтобы инференс не задерживал приём аудио
+    proc_lock: asyncio.Lock = field(default_factory=asyncio.Lock)
     emitted_seq: int = 0
-    emitted_sentences: int = 0
     full_text: str = ""
+    text_base: str = ""  # текст, распознанный до передачи сессии этому воркеру (без streaming)
+    time_base: float = 0.0  # сколько секунд аудио пришлось на прежних воркеров (без streaming)
+    partial_text: str = ""
     closed: bool = False
+    pending_bytes: int = 0
+    timer: Optional[asyncio.TimerHandle] = None
+    processing: bool = False
+    rerun: bool = False
+    backlogged: bool = False  # последний цикл обработки упёрся в QueueFull
+    stream: Optional[StreamingTranscriber] = None
+    pcm: Optional[PCMRingBuffer] = None
+    decoder: Optional[StreamDecoder] = None
+    raw_file: Optional[IO[bytes]] = None
+    chunker: Optional[StreamingChunker] = None
+    duration_sec: float = 0.0
+    lang: str = "ru-RU"
+    started_at: float = field(default_factory=time.monotonic)
+    last_activity: float = field(default_factory=time.monotonic)
+    closed_at: float = 0.0
+    webhook_fallback: bool = False  # live-отправка не удалась, чанки идут через outbox
+    closing: Optional["asyncio.Future[dict]"] = None  # идущее закрытие (close_session)
+
+    def memory_bytes(self) -> int:
+        """Грубая оценка памяти состояния: PCM-буфер + тексты + сегменты."""
+        n = len(self.full_text) * 2 + len(self.partial_text) * 2
+        if self.pcm is not None:
+            n += self.pcm.capacity * 4
+        return n
 
 class SessionManager:
     def __init__(self) -> None:
         self.states: Dict[str, LiveState] = {}
-        self.asr = ASREngine()
+        # session_id → время detach(): кадры и eos для них сюда больше не идут
+        self._detached: Dict[str, float] = {}
+        self._listeners: Dict[str, List[Listener]] = {}
+        self.asr = ASR_ENGINE
+        self._flush_task: Optional[asyncio.Task] = None
+        self._sweep_task: Optional[asyncio.Task] = None
+        self.evictions: Dict[str, int] = {}
+        self.rejected = 0
+        self.timer_fires = 0
+        self.frames_coalesced = 0
+        self.process_runs = 0
+
+    def start(self) -> None:
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        if self._sweep_task is None:
+            self._sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def shutdown(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            self._sweep_task = None
+        await self.flush_bytes()
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.app.session_sweep_sec)
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("session sweep failed")
+
+    def _evicted(self, reason: str) -> None:
+        self.evictions[reason] = self.evictions.get(reason, 0) + 1
+        metrics.SESSION_EVICTIONS.inc(reason=reason)
+
+    async def sweep(self, now: float | None = None) -> None:
+        """Закрывает брошенные сессии и выгружает из памяти закрытые.
+
+        Открытая сессия закрывается (с финальной обработкой и записью в БД),
+        если аудио не приходило live_idle_timeout_sec или она старше
+        live_max_age_sec. Закрытые держатся closed_retention_sec для
+        повторного close, но не больше max_closed_sessions (LRU по закрытию).
+        """
+        now = time.monotonic() if now is None else now
+        cfg = settings.app
+        for state in list(self.states.values()):
+            if state.closed or state.closing is not None or state.processing:
+                continue
+            if now - state.last_activity > cfg.live_idle_timeout_sec:
+                reason = "idle"
+            elif now - state.started_at > cfg.live_max_age_sec:
+                reason = "max_age"
+            else:
+                continue
+            try:
+                await self.close_session(state.session_id, state.lang)
+            except Exception:
+                # одна сломанная сессия не должна держать вытеснение остальных
+                logger.exception("sweep: close_session failed", extra={"session_id": state.session_id})
+                continue
+            self._evicted(reason)
+        closed = sorted((st for st in self.states.values() if st.closed), key=lambda st: st.closed_at)
+        excess = len(closed) - cfg.max_closed_sessions
+        for i, state in enumerate(closed):
+            if now - state.closed_at > cfg.closed_retention_sec:
+                self._drop(state)
+                self._evicted("closed_ttl")
+            elif i < excess:
+                self._drop(state)
+                self._evicted("closed_lru")
+        for sid, at in list(self._detached.items()):
+            if now - at > cfg.closed_retention_sec:
+                del self._detached[sid]
 
-    def _ensure_session(self, session_id: str, lang: str, tier: str = "Basic") -> LiveState:
+    def _drop(self, state: LiveState) -> None:
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+        if state.raw_file is not None:
+            state.raw_file.close()
+            state.raw_file = None
+        if not settings.app.save_raw_audio and os.path.exists(state.tmp_path):
+            os.remove(state.tmp_path)
+        self.states.pop(state.session_id, None)
+
+    def subscribe(self, session_id: str, listener: Listener) -> None:
+        """listener получает partial и chunk сессии сразу после их появления."""
+        self._listeners.setdefault(session_id, []).append(listener)
+
+    def unsubscribe(self, session_id: str, listener: Listener) -> None:
+        listeners = self._listeners.get(session_id)
+        if listeners and listener in listeners:
+            listeners.remove(listener)
+            if not listeners:
+                del self._listeners[session_id]
+
+    def _notify(self, session_id: str, event: Dict[str, Any]) -> None:
+        for listener in list(self._listeners.get(session_id, ())):
+            try:
+                listener(event)
+            except Exception:
+                pass
+
+    def is_detached(self, session_id: str) -> bool:
+        return session_id in self._detached
+
+    def lagging(self, session_id: str) -> bool:
+        """Обработка сессии не успевает за аудио: клиенту стоит притормозить."""
+        state = self.states.get(session_id)
+        return state is not None and state.backlogged
+
+    def open_sessions(self) -> int:
+        return sum(1 for st in self.states.values() if not st.closed)
+
+    def memory_bytes(self) -> int:
+        return sum(st.memory_bytes() for st in self.states.values())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.app.bytes_flush_ms / 1000.0)
+            try:
+                await self.flush_bytes()
+            except Exception:
+                # БД недоступна — счётчики остаются в памяти до следующей попытки
+                pass
+
+    async def flush_bytes(self, session_id: str | None = None) -> int:
+        """Одним executemany дописывает накопленные received_bytes в sessions.
+
+        Счётчики живут в памяти между сбросами: при падении процесса
+        теряется не больше, чем принято за app.bytes_flush_ms.
+        """
+        if session_id is not None:
+            st = self.states.get(session_id)
+            states = [st] if st else []
+        else:
+            states = list(self.states.values())
+        batch = [{"b_id": st.session_id, "b_n": st.pending_bytes} for st in states if st.pending_bytes]
+        if not batch:
+            return 0
+        for row in batch:
+            self.states[row["b_id"]].pending_bytes -= row["b_n"]
+        table = SessionModel.__table__
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .values(received_bytes=table.c.received_bytes + bindparam("b_n"))
+        )
+        try:
+            async with async_engine.begin() as conn:
+                await conn.execute(stmt, batch)
+        except Exception:
+            for row in batch:
+                st = self.states.get(row["b_id"])
+                if st:
+                    st.pending_bytes += row["b_n"]
+            raise
+        return len(batch)
+
+    async def _ensure_session(self, session_id: str, lang: str, tier: str = "Basic") -> LiveState:
+        state = self.states.get(session_id)
+        if state is not None:
+            if state.closed or state.closing is not None:
+                # закрытая сессия ждёт sweep в памяти — аудио после eos не принимаем
+                raise SessionClosed(session_id)
+            return state
+        if self.open_sessions() >= settings.app.max_live_sessions:
+            self.rejected += 1
+            raise SessionLimitExceeded(session_id)
+        async with get_async_session() as s:
+            existing = await s.get(SessionModel, session_id)
+            if existing and existing.status == "closed":
+                raise SessionClosed(session_id)
+            if not existing:
+                s.add(SessionModel(id=session_id, lang=lang, tier=tier))
+                await s.commit()
         if session_id in self.states:
+            # пока ждали БД, сессию создал параллельный кадр
             return self.states[session_id]
-        os.makedirs("/app/tmp", exist_ok=True)
-        tmp_path = f"/app/tmp/{session_id}.webm"
-        state = LiveState(session_id=session_id, tmp_path=tmp_path)
+        tmp_path = os.path.join(TMP_DIR, f"{session_id}.webm")
+        state = LiveState(session_id=session_id, tmp_path=tmp_path, lang=lang)
+        state.chunker = StreamingChunker(session_id, lang)
+        if settings.asr.streaming and not self.asr.stub:
+            state.pcm = PCMRingBuffer(int(settings.asr.stream_buffer_sec * SAMPLE_RATE))
+            state.decoder = StreamDecoder(state.pcm)
+            state.stream = StreamingTranscriber(self.asr)
+        # файл на диске нужен только для сохранения сырого аудио
+        # или для распознавания целиком (без streaming)
+        if settings.app.save_raw_audio or (state.stream is None and not self.asr.stub):
+            os.makedirs(TMP_DIR, exist_ok=True)
+            state.raw_file = open(tmp_path, "ab")
         self.states[session_id] = state
-        with get_session() as s:
-            existing = s.get(SessionModel, session_id)
-            if not existing:
-                s.add(SessionModel(id=session_id, lang=lang, tier=tier))
-                s.commit()
         return state
 
     async def append_audio(self, session_id: str, lang: str, data: bytes) -> None:
-        state = self._ensure_session(session_id, lang)
+        if session_id in self._detached:
+            # иначе кадр создал бы новую LiveState с seq 1 поверх переданной сессии
+            raise SessionDetached(session_id)
+        state = await self._ensure_session(session_id, lang)
         async with state.lock:
-            with open(state.tmp_path, "ab") as f:
-                f.write(data)
+            if state.closed or state.closing is not None:
+                # close_session успел закрыть сессию, пока кадр ждал блокировку
+                raise SessionClosed(session_id)
+            if state.decoder is not None:
+                await state.decoder.feed(data)
+            if state.raw_file is not None:
+                state.raw_file.write(data)
+                state.raw_file.flush()
             state.last_debounce = time.time()
-            with get_session() as s:
-                m = s.get(SessionModel, session_id)
-                if m:
-                    m.received_bytes += len(data)
-                    s.add(m); s.commit()
-        asyncio.create_task(self._debounced_process(session_id, lang))
-
-    async def _debounced_process(self, session_id: str, lang: str) -> None:
-        await asyncio.sleep(settings.app.ws_debounce_ms / 1000.0)
+            state.last_activity = time.monotonic()
+            state.pending_bytes += len(data)
+        if state.timer is None:
+            self._arm(state, lang, settings.app.ws_debounce_ms / 1000.0)
+        else:
+            self.frames_coalesced += 1
+
+    # Один таймер на сессию: новые кадры лишь сдвигают last_debounce,
+    # а сработавший раньше срока таймер переставляет себя на остаток.
+    def _arm(self, state: LiveState, lang: str, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        state.timer = loop.call_later(delay, self._on_timer, state.session_id, lang)
+
+    def _on_timer(self, session_id: str, lang: str) -> None:
         state = self.states.get(session_id)
-        if not state or state.closed:
+        if not state:
+            return
+        state.timer = None
+        if state.closed or state.closing is not None:
+            return
+        remaining = state.last_debounce + settings.app.ws_debounce_ms / 1000.0 - time.time()
+        if remaining > 0.05:
+            self._arm(state, lang, remaining)
+            return
+        self.timer_fires += 1
+        if state.processing:
+            state.rerun = True
             return
-        if time.time() - state.last_debounce < (settings.app.ws_debounce_ms / 1000.0) - 0.05:
+        asyncio.create_task(self._run_processing(session_id, lang))
+
+    async def _run_processing(self, session_id: str, lang: str) -> None:
+        state = self.states.get(session_id)
+        if state is None:
             return
-        await self._process_now(session_id, lang)
+        state.processing = True
+        try:
+            await self._process_now(session_id, lang)
+        finally:
+            state.processing = False
+        if state.rerun and not state.closed:
+            state.rerun = False
+            asyncio.create_task(self._run_processing(session_id, lang))
+
+    def scheduler_stats(self) -> dict:
+        return {
+            "sessions": len(self.states),
+            "pending_timers": sum(1 for st in self.states.values() if st.timer is not None),
+            "processing": sum(1 for st in self.states.values() if st.processing),
+            "timer_fires": self.timer_fires,
+            "frames_coalesced": self.frames_coalesced,
+            "process_runs": self.process_runs,
+            "open": self.open_sessions(),
+            "rejected": self.rejected,
+            "evictions": dict(self.evictions),
+            "memory_bytes": self.memory_bytes(),
+        }
+
+    async def _transcribe(self, state: LiveState, final: bool) -> Tuple[str, List[ASRSegment]]:
+        """Распознаёт новое аудио: (текст, сегменты).
 
-    async def _process_now(self, session_id: str, lang: str) -> None:
+        В streaming-режиме это только что зафиксированный текст, без
+        streaming — весь текст файла, распознанного заново.
+        """
+        while True:
+            try:
+                if state.stream is None:
+                    # файл каждый раз распознаётся целиком
+                    res = await ASR_EXECUTOR.run(self.asr.transcribe_file, state.tmp_path, "live")
+                    state.duration_sec = state.time_base + res.duration
+                    state.full_text = (state.text_base + " " + res.text.strip()).strip()
+                    segments = res.segments
+                    if state.time_base:
+                        # файл начался с передачи сессии — таймкоды продолжают прежние
+                        segments = [ASRSegment(s.start + state.time_base, s.end + state.time_base, s.text) for s in segments]
+                    return res.text.strip(), segments
+                step = await ASR_EXECUTOR.run(state.stream.step, state.pcm, final)
+                if step.committed:
+                    state.full_text = (state.full_text + " " + step.committed).strip()
+                state.duration_sec = state.pcm.end / SAMPLE_RATE
+                state.partial_text = step.partial
+                return step.committed, step.segments
+            except QueueFull as e:
+                if not final:
+                    raise
+                # финальный проход нельзя пропустить — ждём место в очереди
+                await asyncio.sleep(e.retry_after)
+
+    def _chunk(self, state: LiveState, text: str, segments: List[ASRSegment], final: bool, settle: bool = False) -> List[ChunkDTO]:
+        """settle — аудио на этом воркере больше не будет (handoff): последнее предложение тоже
+        уходит в чанкер, но неполный буфер не сбрасывается чанком."""
+        chunker = state.chunker
+        assert chunker is not None
+        if state.stream is not None:
+            chunks = chunker.feed(text, segments)
+        else:
+            # файл распознаётся целиком каждый раз: в чанкер идут только новые
+            # предложения, а последнее (может измениться) — лишь в финале
+            sents = split_sentences(text)
+            times = sentence_times(sents, segments)
+            upto = len(sents) if final or settle else len(sents) - 1
+            chunks = []
+            for i in range(chunker.sentences, upto):
+                ch = chunker.add_sentence(sents[i], times[i] if times else None)
+                if ch is not None:
+                    chunks.append(ch)
+        if final:
+            chunks += chunker.flush()
+        state.emitted_seq = chunker.next_seq - 1
+        return chunks
+
+    async def _process_now(self, session_id: str, lang: str, final: bool = False, flush_audio: bool = False) -> None:
+        """flush_audio — зафиксировать всё принятое аудио, но не закрывать чанкер (handoff)."""
         state = self.states[session_id]
-        async with state.lock:
-            res = self.asr.transcribe_file(state.tmp_path)
-            text = res.text.strip()
-            if not text:
+        async with state.proc_lock:
+            if state.closed or (state.closing is not None and not final):
+                # сессию закрывают: финальный проход обработает всё сам
                 return
-            sents = split_sentences(text)
-            new_sents = sents[state.emitted_sentences:]
-            if not new_sents:
+            self.process_runs += 1
+            try:
+                text, segments = await self._transcribe(state, final or flush_audio)
+            except QueueFull as e:
+                # очередь ASR занята — попробуем позже
+                state.backlogged = True
+                if state.timer is None and not state.closed:
+                    self._arm(state, lang, e.retry_after)
                 return
-            chunks = make_chunks(session_id, new_sents, start_seq=state.emitted_seq + 1)
+            state.backlogged = False
+            if session_id in self._listeners and (text or state.partial_text):
+                # в streaming-режиме text — только что зафиксированное, partial_text — ещё
+                # изменчивый хвост; без streaming весь текст распознаётся заново
+                self._notify(session_id, {
+                    "type": "partial",
+                    "session_id": session_id,
+                    "committed": text if state.stream is not None else "",
+                    "text": state.partial_text if state.stream is not None else state.full_text,
+                })
+            with metrics.CHUNKING.time(tier=settings.app.tier, mode="live"):
+                chunks = self._chunk(state, text, segments, final, flush_audio)
             if not chunks:
                 return
+            # все чанки цикла — одной вставкой и одним commit
+            with metrics.DB_PERSIST.time(tier=settings.app.tier, mode="live"):
+                async with get_async_session() as ds:
+                    await insert_chunks(ds, session_id, chunks[0].lang, chunks)
+                    await ds.commit()
+            created_at = datetime.utcnow().isoformat() + "Z"
+            payloads = [
+                {
+                    "session_id": ch.session_id,
+                    "chunk_id": ch.chunk_id,
+                    "seq": ch.seq,
+                    "text": ch.text,
+                    "overlap_prefix": ch.overlap_prefix,
+                    "lang": ch.lang,
+                    "policy": ch.policy,
+                    "hash": ch.hash,
+                    "start_sec": ch.start_sec,
+                    "end_sec": ch.end_sec,
+                    "created_at": created_at,
+                }
+                for ch in chunks
+            ]
+            if session_id in self._listeners:
+                for payload in payloads:
+                    self._notify(session_id, {"type": "chunk", **payload})
             webhook = await get_active_webhook()
-            for ch in chunks:
-                import orjson
-                with get_session() as ds:
-                    cm = ChunkModel(
-                        session_id=session_id,
-                        chunk_id=ch.chunk_id,
-                        seq=ch.seq,
-                        text=ch.text,
-                        overlap_prefix=ch.overlap_prefix,
-                        lang=ch.lang,
-                        policy_json=orjson.dumps(ch.policy).decode("utf-8"),
-                        hash=ch.hash,
-                    )
-                    ds.add(cm); ds.commit()
-                if webhook:
-                    payload = {
-                        "session_id": ch.session_id,
-                        "chunk_id": ch.chunk_id,
-                        "seq": ch.seq,
-                        "text": ch.text,
-                        "overlap_prefix": ch.overlap_prefix,
-                        "lang": ch.lang,
-                        "policy": ch.policy,
-                        "hash": ch.hash,
-                        "created_at": datetime.utcnow().isoformat() + "Z"
-                    }
-                    try:
+            delivered: List[str] = []
+            fallback: List[Tuple[str, Dict[str, Any], str]] = []
+            for ch, payload in zip(chunks, payloads):
+                if not webhook:
+                    continue
+                if state.webhook_fallback:
+                    # перед этим чанком в outbox уже есть недоставленные — идём следом
+                    metrics.LIVE_CHUNK_FALLBACK.inc(reason="queued")
+                    fallback.append(("webhook", payload, f"{session_id}:{ch.chunk_id}"))
+                    continue
+                try:
+                    with metrics.CHUNK_DELIVERY.time(path="webhook"):
                         await send_chunk(webhook, payload)
-                        with get_session() as ds:
-                            row = ds.exec(select(ChunkModel).where(ChunkModel.chunk_id == ch.chunk_id)).first()
-                            if row:
-                                row.delivered_at = datetime.utcnow(); ds.add(row); ds.commit()
-                    except Exception:
-                        pass
-                state.emitted_seq = ch.seq
-            state.emitted_sentences = len(sents)
-            state.full_text = text
+                    delivered.append(ch.chunk_id)
+                except Exception as e:
+                    # цепь открыта или отправка не удалась — этот и все следующие
+                    # чанки сессии уходят на тот же вебхук через outbox, по порядку
+                    reason = "circuit_open" if isinstance(e, CircuitOpen) else "error"
+                    metrics.LIVE_CHUNK_FALLBACK.inc(reason=reason)
+                    state.webhook_fallback = True
+                    fallback.append(("webhook", payload, f"{session_id}:{ch.chunk_id}"))
+            if fallback:
+                logger.warning("live webhook failed, chunks queued to outbox", extra={
+                    "session_id": session_id, "chunks": len(fallback),
+                })
+                async with get_async_session() as ds:
+                    await enqueue_many(ds, fallback)
+                    await ds.commit()
+                DISPATCHER.wake()
+            if delivered:
+                # одна запись delivered_at на весь цикл обработки
+                async with async_engine.begin() as conn:
+                    await conn.execute(
+                        update(ChunkModel.__table__)
+                        .where(ChunkModel.__table__.c.chunk_id.in_(delivered))
+                        .values(delivered_at=datetime.utcnow())
+                    )
+
+    async def detach(
+        self,
+        session_id: str,
+        persist: Callable[[Dict[str, Any]], Awaitable[None]],
+        url: str = "",
+        retry_url: str = "",
+    ) -> Optional[Dict[str, Any]]:
+        """Снимает открытую сессию с этого воркера и передаёт её снимок в persist.
+
+        Принятое аудио распознаётся до конца, готовые чанки сохраняются;
+        незавершённое предложение и буфер чанкера переходят в снимок. Сессия
+        в БД остаётся открытой. Подписчики получают событие handoff на url
+        только после persist: иначе клиент успел бы переподключиться раньше,
+        чем снимок доступен новому владельцу.
+
+        Если persist не удался, сессия остаётся здесь. Декодер к этому моменту
+        уже закрыт (следующий кадр запустит его заново), поэтому в
+        streaming-режиме клиент получает handoff на retry_url и начинает
+        новый поток с заголовком контейнера.
+        """
+        state = self.states.get(session_id)
+        if state is None or state.closed or state.closing is not None:
+            return None
+        self._detached[session_id] = time.monotonic()
+        decoder_closed = False
+        try:
+            if state.decoder is not None:
+                decoder_closed = True
+                async with state.lock:
+                    await state.decoder.close()
+            await self._process_now(session_id, state.lang, flush_audio=True)
+            await self.flush_bytes(session_id)
+            assert state.chunker is not None
+            snapshot = {
+                "lang": state.lang,
+                "full_text": state.full_text,
+                "emitted_seq": state.emitted_seq,
+                "duration_sec": state.duration_sec,
+                "age_sec": time.monotonic() - state.started_at,
+                "webhook_fallback": state.webhook_fallback,
+                "chunker": state.chunker.snapshot(),
+            }
+            await persist(snapshot)
+        except BaseException:
+            # передача не состоялась — сессия остаётся здесь
+            self._detached.pop(session_id, None)
+            if decoder_closed:
+                self._notify(session_id, {"type": "handoff", "session_id": session_id, "url": retry_url})
+            raise
+        self._notify(session_id, {"type": "handoff", "session_id": session_id, "url": url})
+        self._drop(state)
+        return snapshot
+
+    async def adopt(self, session_id: str, snapshot: Dict[str, Any]) -> LiveState:
+        """Продолжает сессию по снимку detach() с другого воркера.
+
+        Таймкоды и нумерация чанков продолжаются с места передачи. Клиент
+        начинает новый поток (с заголовком контейнера) — декодер здесь свой.
+        """
+        if session_id in self.states:
+            return self.states[session_id]
+        self._detached.pop(session_id, None)
+        state = await self._ensure_session(session_id, snapshot.get("lang", "ru-RU"))
+        state.full_text = snapshot.get("full_text", "")
+        state.emitted_seq = snapshot.get("emitted_seq", 0)
+        state.duration_sec = snapshot.get("duration_sec", 0.0)
+        state.started_at = time.monotonic() - snapshot.get("age_sec", 0.0)
+        state.webhook_fallback = snapshot.get("webhook_fallback", False)
+        state.chunker = StreamingChunker.from_snapshot(session_id, snapshot.get("chunker") or {})
+        if state.stream is not None and state.pcm is not None:
+            state.pcm.seek(int(state.duration_sec * SAMPLE_RATE))
+            state.stream.committed_samples = state.pcm.start
+            state.stream.prompt = state.full_text[-state.stream.prompt_chars:]
+        else:
+            # файл здесь новый: предложения и таймкоды считаются с нуля,
+            # прежние текст и длительность — префикс
+            state.text_base = state.full_text
+            state.time_base = state.duration_sec
+            state.chunker.sentences = 0
+        return state
 
     async def close_session(self, session_id: str, lang: str) -> dict:
         state = self.states.get(session_id)
-        if not state:
+        if not state or session_id in self._detached:
             return {"session_id": session_id, "text_full": "", "duration_sec": 0.0, "total_chunks": 0, "lang": lang}
-        await self._process_now(session_id, lang)
+        if state.closing is None:
+            # закрытие одно на сессию: повторный и параллельный вызовы ждут его итога
+            state.closing = asyncio.ensure_future(self._close(state, lang))
+        return await asyncio.shield(state.closing)
+
+    async def _close(self, state: LiveState, lang: str) -> dict:
+        try:
+            return await self._finish(state, lang)
+        except BaseException:
+            # закрытие не удалось — sweep или клиент попробуют ещё раз
+            state.closing = None
+            raise
+
+    async def _finish(self, state: LiveState, lang: str) -> dict:
+        session_id = state.session_id
+        if state.decoder is not None:
+            async with state.lock:
+                await state.decoder.close()
+        await self._process_now(session_id, lang, final=True)
         async with state.lock:
             state.closed = True
+            state.closed_at = time.monotonic()
+            if state.timer is not None:
+                state.timer.cancel()
+                state.timer = None
+            if state.raw_file is not None:
+                state.raw_file.close()
+                state.raw_file = None
+                if not settings.app.save_raw_audio:
+                    os.remove(state.tmp_path)
+            # до выгрузки из памяти закрытой сессии нужен только итоговый текст
+            state.pcm = None
+            state.decoder = None
+            state.stream = None
+            state.chunker = None
             full = state.full_text
-            with get_session() as s:
-                sm = s.get(SessionModel, session_id)
+            async with get_async_session() as s:
+                sm = await s.get(SessionModel, session_id)
                 if sm:
+                    # остаток счётчика байтов уходит вместе с закрытием сессии
+                    sm.received_bytes += state.pending_bytes
                     sm.ended_at = datetime.utcnow(); sm.status = "closed"
-                    s.add(sm); s.commit()
-            with get_session() as s:
-                total_chunks = s.exec(select(ChunkModel).where(ChunkModel.session_id == session_id)).all()
+                    s.add(sm); await s.commit()
+                    state.pending_bytes = 0
+            async with get_async_session() as s:
+                total_chunks = (await s.exec(select(ChunkModel).where(ChunkModel.session_id == session_id))).all()
                 total_chunks = len(total_chunks)
-                tr = TranscriptModel(session_id=session_id, text_full=full, duration_sec=0.0, total_chunks=total_chunks, lang=lang)
-                s.add(tr); s.commit()
-            return {"session_id": session_id, "text_full": full, "duration_sec": 0.0, "total_chunks": total_chunks, "lang": lang}
+                await upsert_transcript(s, session_id, full, lang, total_chunks, state.duration_sec)
+                await s.commit()
+            return {"session_id": session_id, "text_full": full, "duration_sec": state.duration_sec, "total_chunks": total_chunks, "lang": lang}
 
 SESSION_MANAGER = SessionManager()
\ No newline at end of file
@@ -0,0 +1,148 @@
+from __future__ import annotations
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Sequence, Tuple
+
+import orjson
+from sqlalchemy import and_, case, delete, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..models import ChunkModel, OutboxModel, TranscriptModel
+from .chunker import ChunkDTO
+
+
+def _chunk_rows(session_id: str, lang: str, chunks: Sequence[ChunkDTO], now: datetime) -> List[Dict[str, Any]]:
+    policies: Dict[int, str] = {}
+    rows: List[Dict[str, Any]] = []
+    for ch in chunks:
+        pj = policies.get(id(ch.policy))
+        if pj is None:
+            pj = policies[id(ch.policy)] = orjson.dumps(ch.policy).decode("utf-8")
+        rows.append({
+            "id": str(uuid.uuid4()),
+            "session_id": session_id,
+            "chunk_id": ch.chunk_id,
+            "seq": ch.seq,
+            "text": ch.text,
+            "overlap_prefix": ch.overlap_prefix,
+            "lang": lang,
+            "policy_json": pj,
+            "hash": ch.hash,
+            "start_sec": ch.start_sec,
+            "end_sec": ch.end_sec,
+            "created_at": now,
+            "delivered_at": None,
+        })
+    return rows
+
+
+# при повторе (session_id, seq) обновляется содержимое; id строки и created_at остаются
+_UPSERT_COLUMNS = ("chunk_id", "text", "overlap_prefix", "lang", "policy_json", "hash", "start_sec", "end_sec")
+
+
+def _upsert_chunks(dialect: str) -> Any:
+    table = ChunkModel.__table__
+    if dialect == "postgresql":
+        stmt = postgresql.insert(table)
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(table)
+    else:
+        return insert(table)
+    set_ = {c: stmt.excluded[c] for c in _UPSERT_COLUMNS}
+    # тот же текст уже доставлен — отметку не сбрасываем, иначе чанк уйдёт заново
+    set_["delivered_at"] = case((table.c.hash == stmt.excluded.hash, table.c.delivered_at), else_=None)
+    return stmt.on_conflict_do_update(index_elements=[table.c.session_id, table.c.seq], set_=set_)
+
+
+async def insert_chunks(s: AsyncSession, session_id: str, lang: str, chunks: Sequence[ChunkDTO]) -> List[str]:
+    """Пишет все чанки одним executemany в транзакции вызывающего.
+
+    Повторная обработка сессии обновляет строки с теми же (session_id, seq)
+    вместо дублей. Возвращает chunk_id в порядке chunks; commit остаётся
+    за вызывающим.
+    """
+    if not chunks:
+        return []
+    rows = _chunk_rows(session_id, lang, chunks, datetime.utcnow())
+    conn = await s.connection()
+    await conn.execute(_upsert_chunks(conn.dialect.name), rows)
+    return [r["chunk_id"] for r in rows]
+
+
+def _upsert_transcript(dialect: str) -> Any:
+    table = TranscriptModel.__table__
+    if dialect == "postgresql":
+        stmt = postgresql.insert(table)
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(table)
+    else:
+        return insert(table)
+    set_ = {c: stmt.excluded[c] for c in ("text_full", "duration_sec", "total_chunks", "lang", "created_at")}
+    return stmt.on_conflict_do_update(index_elements=[table.c.session_id], set_=set_).returning(table.c.id)
+
+
+async def upsert_transcript(
+    s: AsyncSession,
+    session_id: str,
+    text: str,
+    lang: str,
+    total_chunks: int,
+    duration_sec: float = 0.0,
+) -> str:
+    """Один транскрипт на сессию: повторная обработка перезаписывает его. Возвращает id строки."""
+    tr_id = str(uuid.uuid4())
+    conn = await s.connection()
+    res = await conn.execute(_upsert_transcript(conn.dialect.name).values(
+        id=tr_id,
+        session_id=session_id,
+        text_full=text,
+        duration_sec=duration_sec,
+        total_chunks=total_chunks,
+        lang=lang,
+        created_at=datetime.utcnow(),
+    ))
+    return (res.scalar() if res.returns_rows else None) or tr_id
+
+
+async def _cancel_stale_outbox(s: AsyncSession, session_id: str, keep: Sequence[str]) -> None:
+    """Ожидающая доставка чанков, которых после повторной обработки больше нет
+    (текст изменился — другой chunk_id — или seq за последним новым чанком),
+    отменяется, чтобы в Mod2 не ушла устаревшая версия. Ожидающий финал
+    отменяется всегда: его ключ session_id:final не зависит от текста,
+    и новый финал ставится заново после новых чанков."""
+    chunks = ChunkModel.__table__
+    stale = set((await (await s.connection()).execute(
+        select(chunks.c.chunk_id).where(chunks.c.session_id == session_id)
+    )).scalars()) - set(keep)
+    outbox = OutboxModel.__table__
+    superseded = outbox.c.kind == "final"
+    if stale:
+        superseded = or_(superseded, and_(outbox.c.kind == "chunk", outbox.c.chunk_id.in_(stale)))
+    await (await s.connection()).execute(
+        update(outbox)
+        .where(outbox.c.session_id == session_id, outbox.c.status == "pending", superseded)
+        .values(status="cancelled", last_error="superseded")
+    )
+
+
+async def save_transcript(
+    s: AsyncSession,
+    session_id: str,
+    text: str,
+    lang: str,
+    chunks: Sequence[ChunkDTO],
+    duration_sec: float = 0.0,
+) -> Tuple[str, List[str]]:
+    """Транскрипт и его чанки — два upsert на весь файл вместо ORM-объекта на строку.
+
+    Чанки описывают весь транскрипт сессии, поэтому хвост прежней обработки
+    с seq за последним новым чанком удаляется, а недоставленные в outbox
+    версии заменённых чанков и прежний финал отменяются.
+    """
+    tr_id = await upsert_transcript(s, session_id, text, lang, len(chunks), duration_sec)
+    await _cancel_stale_outbox(s, session_id, [ch.chunk_id for ch in chunks])
+    conn = await s.connection()
+    table = ChunkModel.__table__
+    await conn.execute(delete(table).where(table.c.session_id == session_id, table.c.seq > len(chunks)))
+    return tr_id, await insert_chunks(s, session_id, lang, chunks)
@@ -0,0 +1,72 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import List
+from ..config import settings
+from .asr import ASREngine, ASRSegment, SAMPLE_RATE
+from .audio import PCMRingBuffer
+
+
+@dataclass
+class StreamStep:
+    committed: str  # только что зафиксированный текст
+    partial: str    # гипотеза по незафиксированному хвосту
+    # зафиксированные сегменты с таймкодами от начала сессии
+    segments: List[ASRSegment] = field(default_factory=list)
+
+
+class StreamingTranscriber:
+    """Инкрементальное распознавание растущего аудиопотока одной сессии.
+
+    Каждый шаг распознаёт только аудио после последней зафиксированной
+    границы сегмента. Сегменты, закончившиеся раньше, чем за holdback до
+    конца окна, фиксируются; остальное считается частичным и
+    перераспознаётся на следующем шаге. Контекст прошлых шагов передаётся
+    модели как initial_prompt из последних prompt_chars символов.
+    """
+
+    def __init__(self, engine: ASREngine) -> None:
+        self.engine = engine
+        self.holdback_sec = settings.asr.stream_holdback_sec
+        self.max_window_sec = settings.asr.stream_max_window_sec
+        self.prompt_chars = settings.asr.stream_prompt_chars
+        self.committed_samples = 0
+        self.prompt = ""
+
+    def step(self, pcm: PCMRingBuffer, final: bool = False) -> StreamStep:
+        # если буфер переполнился, начало окна могло быть уже отброшено
+        self.committed_samples, window = pcm.window(self.committed_samples)
+        win_sec = len(window) / SAMPLE_RATE
+        if win_sec <= 0:
+            return StreamStep("", "")
+        res = self.engine.transcribe_audio(window, initial_prompt=self.prompt or None, mode="live")
+        if final or win_sec >= self.max_window_sec:
+            cutoff = win_sec
+        else:
+            cutoff = win_sec - self.holdback_sec
+
+        done = 0
+        while done < len(res.segments) and res.segments[done].end <= cutoff:
+            done += 1
+        offset = self.committed_samples / SAMPLE_RATE
+        done_segments = [
+            ASRSegment(start=seg.start + offset, end=seg.end + offset, text=seg.text)
+            for seg in res.segments[:done]
+        ]
+        committed = " ".join(seg.text.strip() for seg in res.segments[:done]).strip()
+        partial = " ".join(seg.text.strip() for seg in res.segments[done:]).strip()
+
+        if done:
+            advance = res.segments[done - 1].end
+        elif not res.segments:
+            # в окне только тишина — не распознаём её повторно
+            advance = max(0.0, cutoff)
+        else:
+            advance = 0.0
+        if final:
+            advance = win_sec
+        self.committed_samples += int(advance * SAMPLE_RATE)
+        pcm.release(self.committed_samples)
+
+        if committed:
+            self.prompt = (self.prompt + " " + committed).strip()[-self.prompt_chars:]
+        return StreamStep(committed, partial, done_segments)
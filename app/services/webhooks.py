@@ -1,32 +1,59 @@
 from __future__ import annotations
-import hmac, hashlib, json
-import httpx
+import os, time, hmac, hashlib, json
+from dataclasses import dataclass
 from typing import Optional
+import httpx
 from sqlmodel import select
-from ..db import get_session
+from ..db import get_async_session
 from ..models import WebhookModel
+from ..delivery.client import post
 
 HEADER_NAME = "X-Signature"
+# set_webhook сбрасывает кэш своего процесса; TTL ограничивает устаревание
+# в остальных воркерах
+CACHE_TTL_SEC = float(os.getenv("WEBHOOK_CACHE_TTL_SEC", "30"))
 
-async def get_active_webhook() -> Optional[WebhookModel]:
-    with get_session() as s:
-        wh = s.exec(select(WebhookModel).where(WebhookModel.active == True)).first()  # noqa: E712
-        return wh
+@dataclass(frozen=True)
+class WebhookCfg:
+    url: str
+    secret: str
+
+_cached: Optional[WebhookCfg] = None
+_cached_at: Optional[float] = None
+
+def invalidate_webhook_cache() -> None:
+    global _cached_at
+    _cached_at = None
+
+async def get_active_webhook() -> Optional[WebhookCfg]:
+    global _cached, _cached_at
+    now = time.monotonic()
+    if _cached_at is None or now - _cached_at > CACHE_TTL_SEC:
+        async with get_async_session() as s:
+            wh = (await s.exec(select(WebhookModel).where(WebhookModel.active == True))).first()  # noqa: E712
+            _cached = WebhookCfg(url=wh.url, secret=wh.secret) if wh else None
+        _cached_at = now
+    return _cached
 
 async def set_webhook(url: str, secret: str) -> WebhookModel:
-    with get_session() as s:
-        wh = s.exec(select(WebhookModel).where(WebhookModel.active == True)).first()  # noqa: E712
+    async with get_async_session() as s:
+        wh = (await s.exec(select(WebhookModel).where(WebhookModel.active == True))).first()  # noqa: E712
         if wh:
             wh.url = url
             wh.secret = secret
         else:
             wh = WebhookModel(url=url, secret=secret, active=True)
             s.add(wh)
-        s.commit(); s.refresh(wh)
+        await s.commit(); await s.refresh(wh)
+        invalidate_webhook_cache()
         return wh
 
-async def send_chunk(webhook: WebhookModel, payload: dict) -> None:
+async def post_webhook(webhook: WebhookCfg, payload: dict) -> httpx.Response:
     body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
     sig = hmac.new(webhook.secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
-    async with httpx.AsyncClient(timeout=5.0) as client:
-        await client.post(webhook.url, content=body, headers={HEADER_NAME: f"sha256={sig}", "Content-Type": "application/json"})
\ No newline at end of file
+    return await post(webhook.url, body, {HEADER_NAME: f"sha256={sig}", "Content-Type": "application/json"}, timeout=5.0)
+
+async def send_chunk(webhook: WebhookCfg, payload: dict) -> None:
+    """Ответ не 2xx — исключение: вызывающий отправит чанк через outbox."""
+    resp = await post_webhook(webhook, payload)
+    resp.raise_for_status()
\ No newline at end of file
@@ -0,0 +1,86 @@
+from __future__ import annotations
+import asyncio, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from ..config import settings
+
+
+class QueueFull(Exception):
+    """Очередь ASR переполнена — клиенту стоит повторить позже."""
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("ASR queue is full")
+        self.retry_after = retry_after
+
+
+class ASRExecutor:
+    """Ограниченный пул потоков для блокирующего инференса.
+
+    CTranslate2 отпускает GIL во время декодирования, поэтому потоки
+    масштабируются по ядрам и делят модели из общего ModelPool.
+    Одновременно принимается не больше workers + queue_max задач,
+    остальные сразу получают QueueFull.
+    """
+
+    def __init__(self, workers: int, queue_max: int, retry_after: int) -> None:
+        self.workers = max(1, workers)
+        self.queue_max = max(0, queue_max)
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="asr")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_max
+
+    def _call(self, fn: Callable[..., Any], args: tuple) -> Any:
+        with self._lock:
+            self._running += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _release(self, _fut: Any) -> None:
+        # снимаем задачу из учёта по факту завершения в потоке,
+        # даже если ожидавшая её корутина уже отменена
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            if self._pending >= self.capacity:
+                self.rejected += 1
+                raise QueueFull(self.retry_after)
+            self._pending += 1
+        fut = self._pool.submit(self._call, fn, args)
+        fut.add_done_callback(self._release)
+        return await asyncio.wrap_future(fut)
+
+    def load(self) -> float:
+        """Доля занятых мест: (выполняются + ждут) / capacity."""
+        with self._lock:
+            return self._pending / self.capacity
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_max": self.queue_max,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+ASR_EXECUTOR = ASRExecutor(settings.asr.workers, settings.asr.queue_max, settings.asr.retry_after_sec)
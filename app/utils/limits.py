@@ -0,0 +1,102 @@
+from __future__ import annotations
+import json, time
+from typing import Any, Awaitable, Callable, Dict, MutableMapping
+
+from ..config import settings
+from ..services import metrics
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+
+# запас на заголовки multipart поверх размера самого файла
+MULTIPART_SLACK = 64 * 1024
+
+
+class _TooLarge(Exception):
+    pass
+
+
+def upload_limit_bytes() -> int:
+    return settings.limits[settings.app.tier].max_file_mb * 1024 * 1024 + MULTIPART_SLACK
+
+
+class UploadLimitMiddleware:
+    """Ограничивает тело запроса лимитом тарифа ещё до разбора multipart.
+
+    FastAPI целиком сохраняет UploadFile до вызова обработчика, поэтому
+    проверка в самом обработчике защищает только от обработки, но не от
+    заполнения диска. Здесь запрос с известным Content-Length сверх лимита
+    получает 413 без чтения тела, а потоковая загрузка обрывается, как только
+    прочитанное превысит лимит. Ответ 413 идёт с Connection: close.
+    """
+
+    def __init__(self, app: Callable[..., Awaitable[None]], paths: tuple[str, ...] = ("/v1/transcribe",)) -> None:
+        self.app = app
+        self.paths = paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope.get("method") != "POST" or scope.get("path") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        limit = upload_limit_bytes()
+        headers: Dict[bytes, bytes] = dict(scope.get("headers") or [])
+        try:
+            declared = int(headers.get(b"content-length", b"-1"))
+        except ValueError:
+            declared = -1
+        if declared > limit:
+            await self._reject(send)
+            return
+
+        received = 0
+        exceeded = False
+        started = False
+        t0: float | None = None
+
+        async def limited_receive() -> Message:
+            nonlocal received, exceeded, t0
+            message = await receive()
+            if message["type"] == "http.request":
+                if t0 is None:
+                    t0 = time.perf_counter()
+                if not message.get("more_body", False):
+                    metrics.UPLOAD_RECEIVE.observe(time.perf_counter() - t0, tier=settings.app.tier)
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise _TooLarge()
+            return message
+
+        async def guarded_send(message: Message) -> None:
+            nonlocal started
+            # после превышения ответ приложения (обычно 400 от парсера формы) подменяем на 413
+            if exceeded:
+                if not started:
+                    started = True
+                    await self._reject(send)
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _TooLarge:
+            if not started:
+                await self._reject(send)
+
+    async def _reject(self, send: Send) -> None:
+        body = json.dumps({"detail": f"file too large for tier {settings.app.tier}"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
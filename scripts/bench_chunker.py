@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Микробенчмарк разбиения на предложения и сборки чанков.
+
+Генерирует транскрипт заданного размера (по умолчанию ~1 МБ), меряет
+прежнюю реализацию (регулярка SENT_RX + join буфера на каждом шаге) и
+текущую из app.services.chunker, затем сверяет результаты. Текст для
+сверки не содержит сокращений и инициалов — только на них новый разбор
+намеренно расходится со старым; такие примеры печатаются отдельно.
+
+    python scripts/bench_chunker.py [--mb 1] [--seed 1] [--wide 2000] [--fuzz 2000]
+"""
+from __future__ import annotations
+import argparse, os, random, re, sys, time, uuid
+from typing import List, Optional, Sequence, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import chunker  # noqa: E402
+from app.services.chunker import POLICY, ChunkDTO, _hash, policy  # noqa: E402
+
+# --- прежняя реализация (до линейного разбора), копия для сверки ---
+
+LEGACY_SENT_RX = re.compile(r"\s*(.+?)([.!?…]+)(?=\s+[A-ZА-ЯЁ]|$)")
+
+
+def legacy_split_sentences(text: str) -> List[str]:
+    text = re.sub(r"\s+", " ", text.strip())
+    out: List[str] = []
+    i = 0
+    for m in LEGACY_SENT_RX.finditer(text):
+        sent = (m.group(1) + m.group(2)).strip()
+        out.append(sent)
+        i = m.end()
+    tail = text[i:].strip()
+    if tail:
+        out.append(tail)
+    return out
+
+
+def legacy_make_chunks(
+    session_id: str,
+    sentences: List[str],
+    start_seq: int = 1,
+    times: Optional[Sequence[Tuple[float, float]]] = None,
+) -> List[ChunkDTO]:
+    def span(first: int, last: int) -> Tuple[Optional[float], Optional[float]]:
+        if not times or last >= len(times):
+            return None, None
+        return times[first][0], times[last][1]
+
+    chunks: List[ChunkDTO] = []
+    buf: List[str] = []
+    buf_start = 0
+    seq = start_seq
+    overlap_prev = ""
+    for idx, sent in enumerate(sentences):
+        if not buf:
+            buf_start = idx
+        buf.append(sent)
+        cur_txt = " ".join(buf)
+        if len(buf) >= policy.sent_min and (len(buf) >= policy.sent_max or len(cur_txt) >= policy.char_limit):
+            start_sec, end_sec = span(buf_start, idx)
+            chunks.append(ChunkDTO(session_id, str(uuid.uuid4()), seq, cur_txt, overlap_prev, "ru-RU", POLICY,
+                                   _hash(session_id, seq, cur_txt), start_sec=start_sec, end_sec=end_sec))
+            overlap_prev = buf[-1] if policy.overlap_sent > 0 else ""
+            buf = []
+            seq += 1
+    if buf:
+        text = " ".join(buf)
+        start_sec, end_sec = span(buf_start, len(sentences) - 1)
+        chunks.append(ChunkDTO(session_id, str(uuid.uuid4()), seq, text, overlap_prev, "ru-RU", POLICY,
+                               _hash(session_id, seq, text), start_sec=start_sec, end_sec=end_sec))
+    return chunks
+
+
+# --- генерация текста ---
+
+WORDS = ("собеседование вопрос ответ опыт проект команда задача решение база данных "
+         "сервис очередь модель python запрос время версия 3.5 v2.0 ok").split()
+CAPS = ("Я", "Мы", "Это", "Потом", "Когда", "Да", "Нет", "Python", "Хорошо", "Итак")
+ENDS = (".", ".", ".", "?", "!", "...", "…", "?!", "?..")
+ABBR_SAMPLES = (
+    "Я живу в г. Москва, на ул. Ленина. Это рядом.",
+    "Пушкин, т.е. А. С. Пушкин, писал стихи. Да.",
+    "Стихи писал А. Пушкин. Ответ — Я. Итак.",
+)
+
+
+def sentence(rnd: random.Random) -> str:
+    n = rnd.randint(2, 25)
+    words = [rnd.choice(CAPS)] + [rnd.choice(WORDS) for _ in range(n)]
+    if rnd.random() < 0.1:
+        # многоточие внутри предложения перед строчной буквой не граница
+        words.insert(rnd.randint(1, len(words) - 1), "…")
+    return " ".join(words) + rnd.choice(ENDS)
+
+
+def transcript(rnd: random.Random, size: int) -> str:
+    parts: List[str] = []
+    total = 0
+    while total < size:
+        s = sentence(rnd)
+        parts.append(s)
+        total += len(s.encode("utf-8")) + 1
+        if rnd.random() < 0.02:
+            parts.append("\n")
+    return " ".join(parts)
+
+
+def fuzz_text(rnd: random.Random) -> str:
+    alphabet = ["а", "бв", "Где", "Ты", "x", " ", " ", "  ", "\n", ".", "..", "!", "?", "…", "3.5"]
+    return "".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 40)))
+
+
+def _key(c: ChunkDTO) -> tuple:
+    return (c.seq, c.text, c.overlap_prefix, c.hash, c.start_sec, c.end_sec)
+
+
+def bench(fn, *args, repeat: int = 3) -> Tuple[float, object]:
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--mb", type=float, default=1.0, help="размер транскрипта, МБ")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--wide", type=int, default=2000,
+                    help="sent_max/char_limit во втором прогоне make_chunks: длинный буфер, где join на каждом шаге квадратичен")
+    ap.add_argument("--fuzz", type=int, default=2000, help="число случайных коротких текстов для сверки")
+    args = ap.parse_args()
+
+    rnd = random.Random(args.seed)
+    text = transcript(rnd, int(args.mb * 1024 * 1024))
+    print(f"transcript: {len(text.encode('utf-8')) / 1024 / 1024:.2f} MB, policy={POLICY}")
+
+    t_old, old_sents = bench(legacy_split_sentences, text)
+    t_new, new_sents = bench(chunker.split_sentences, text)
+    print(f"split_sentences: legacy {t_old * 1000:8.1f} ms   new {t_new * 1000:8.1f} ms   ({len(new_sents)} sentences)")
+
+    times = [(float(i), float(i) + 0.5) for i in range(len(new_sents))]
+    t_old_c, old_chunks = bench(legacy_make_chunks, "bench", old_sents, 1, times)
+    t_new_c, new_chunks = bench(chunker.make_chunks, "bench", new_sents, 1, times)
+    print(f"make_chunks:     legacy {t_old_c * 1000:8.1f} ms   new {t_new_c * 1000:8.1f} ms   ({len(new_chunks)} chunks)")
+
+    ok = [_key(c) for c in old_chunks] == [_key(c) for c in new_chunks]
+
+    saved = (policy.sent_max, policy.char_limit)
+    policy.sent_max, policy.char_limit = args.wide, args.wide * 200
+    try:
+        t_old_w, old_wide = bench(legacy_make_chunks, "bench", old_sents, 1, times, repeat=1)
+        t_new_w, new_wide = bench(chunker.make_chunks, "bench", new_sents, 1, times, repeat=1)
+    finally:
+        policy.sent_max, policy.char_limit = saved
+    print(f"make_chunks wide:legacy {t_old_w * 1000:8.1f} ms   new {t_new_w * 1000:8.1f} ms   (sent_max={args.wide})")
+    ok = ok and [_key(c) for c in old_wide] == [_key(c) for c in new_wide]
+    if not ok:
+        print("MISMATCH chunks")
+
+    if old_sents != new_sents:
+        ok = False
+        diff = next(i for i, (a, b) in enumerate(zip(old_sents + [None], new_sents + [None])) if a != b)
+        print(f"MISMATCH sentences at #{diff}: {old_sents[diff:diff + 1]!r} vs {new_sents[diff:diff + 1]!r}")
+
+    for _ in range(args.fuzz):
+        t = fuzz_text(rnd)
+        if legacy_split_sentences(t) != chunker.split_sentences(t):
+            ok = False
+            print(f"MISMATCH fuzz {t!r}: {legacy_split_sentences(t)!r} vs {chunker.split_sentences(t)!r}")
+            break
+
+    print("equivalence:", "ok" if ok else "FAILED")
+    print("abbreviations (expected to differ):")
+    for t in ABBR_SAMPLES:
+        print(f"  legacy {legacy_split_sentences(t)!r}")
+        print(f"  new    {chunker.split_sentences(t)!r}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,20 @@
+import os
+import tempfile
+
+# до импорта app: настройки читаются из окружения при импорте
+_TMP = tempfile.mkdtemp(prefix="mod1-tests-")
+os.environ.setdefault("DB_URL", f"sqlite:///{_TMP}/asr.db")
+os.environ.setdefault("STUB_ASR", "true")
+os.environ.setdefault("ASR_WARMUP", "false")
+
+import pytest  # noqa: E402
+
+import app.models  # noqa: E402,F401  # таблицы для create_all
+from app.db import init_db  # noqa: E402
+
+init_db()
+
+
+@pytest.fixture
+def tmp_dir():
+    return _TMP
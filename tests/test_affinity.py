@@ -0,0 +1,237 @@
+import asyncio
+import uuid
+
+import pytest
+from sqlmodel import select
+
+from app.config import settings
+from app.db import async_engine, get_async_session
+from app.models import ChunkModel
+from app.services import chunker, sessions
+from app.services.affinity import CoordinationStore, HashRing, LocalCoordinationStore, SessionAffinity
+from app.services.asr import ASRResult, ASRSegment
+from app.services.sessions import SESSION_MANAGER, SessionDetached, SessionLimitExceeded
+
+
+def test_store_interface_is_abstract():
+    with pytest.raises(TypeError):
+        CoordinationStore()
+
+
+def test_ring_remaps_about_one_nth():
+    keys = [f"session-{i}" for i in range(20000)]
+    ring = HashRing(["a", "b", "c"], vnodes=64)
+    before = {k: ring.owner(k) for k in keys}
+    ring.set_nodes(["a", "b", "c", "d"])
+    moved = [k for k in keys if ring.owner(k) != before[k]]
+    # переезжают только сессии нового воркера, примерно четверть
+    assert all(ring.owner(k) == "d" for k in moved)
+    assert 0.15 < len(moved) / len(keys) < 0.35
+    ring.set_nodes(["a", "b", "c"])
+    assert all(ring.owner(k) == before[k] for k in keys)
+
+
+def test_claim_is_compare_and_set():
+    async def run():
+        store = LocalCoordinationStore()
+        assert await store.claim("s", "a", None) == "a"
+        # владелец уже есть — второй воркер его не перехватит
+        assert await store.claim("s", "b", None) == "a"
+        assert await store.claim("s", "b", "c") == "a"
+        assert await store.claim("s", "b", "a") == "b"
+        assert await store.owner("s") == "b"
+
+    asyncio.run(run())
+
+
+def test_forget_keeps_foreign_rows_and_handoffs():
+    async def run():
+        store = LocalCoordinationStore()
+        await store.claim("s", "a", None)
+        await store.forget("s", "b")
+        assert await store.owner("s") == "a"
+        await store.put_handoff("s", {"full_text": "x"})
+        await store.forget("s", "a")
+        assert await store.take_handoff("s") == {"full_text": "x"}
+        assert await store.take_handoff("s") is None
+
+    asyncio.run(run())
+
+
+class FakeASR:
+    """Без streaming файл распознаётся целиком: результат — всё, что пришло на этот воркер."""
+    stub = False
+
+    def __init__(self, sentences):
+        self.sentences = sentences
+
+    def transcribe_file(self, path, mode="batch"):
+        segs = [ASRSegment(float(i), float(i + 1), s) for i, s in enumerate(self.sentences)]
+        return ASRResult(" ".join(self.sentences), segs, 1.0, float(len(segs)))
+
+
+def test_drain_handoff_round_trip(monkeypatch, tmp_dir):
+    monkeypatch.setattr(settings.asr, "streaming", False)
+    monkeypatch.setattr(sessions, "TMP_DIR", tmp_dir)
+    monkeypatch.setattr(chunker.policy, "sent_min", 2)
+    monkeypatch.setattr(chunker.policy, "sent_max", 2)
+    sid = f"handoff-{uuid.uuid4().hex[:8]}"
+
+    async def run():
+        try:
+            return await scenario()
+        finally:
+            await async_engine.dispose()
+
+    async def scenario():
+        store = LocalCoordinationStore()
+        a = SessionAffinity(store, "a", "ws://a")
+        b = SessionAffinity(store, "b", "ws://b")
+        await a.start()
+        await b.start()
+        await a.refresh()
+        assert await a.route(sid) in (None, "ws://b")
+
+        events = []
+        SESSION_MANAGER.subscribe(sid, events.append)
+        monkeypatch.setattr(SESSION_MANAGER, "asr", FakeASR(["Раз.", "Два.", "Три."]))
+        await SESSION_MANAGER.append_audio(sid, "ru-RU", b"first")
+        await SESSION_MANAGER._process_now(sid, "ru-RU")
+
+        assert await a.drain() == 1
+        assert events[-1] == {"type": "handoff", "session_id": sid, "url": "ws://b"}
+        # кадры и eos после передачи не создают сессию заново
+        with pytest.raises(SessionDetached):
+            await SESSION_MANAGER.append_audio(sid, "ru-RU", b"late")
+        assert sid not in SESSION_MANAGER.states
+        await a.forget(sid)
+        # уходящий воркер новых сессий не берёт
+        assert await a.route(f"{sid}-new") == "ws://b"
+
+        await b.refresh()  # heartbeat b: a уже снят с кольца
+        assert await b.route(sid) is None
+        assert await b.adopt(sid)
+        monkeypatch.setattr(SESSION_MANAGER, "asr", FakeASR(["Четыре.", "Пять."]))
+        await SESSION_MANAGER.append_audio(sid, "ru-RU", b"second")
+        final = await SESSION_MANAGER.close_session(sid, "ru-RU")
+        await b.forget(sid)
+        SESSION_MANAGER.unsubscribe(sid, events.append)
+        await a.stop()
+        await b.stop()
+
+        async with get_async_session() as s:
+            rows = (await s.exec(
+                select(ChunkModel).where(ChunkModel.session_id == sid).order_by(ChunkModel.seq)
+            )).all()
+        return final, [(r.seq, r.text, r.start_sec, r.end_sec) for r in rows]
+
+    final, rows = asyncio.run(run())
+    assert final["text_full"] == "Раз. Два. Три. Четыре. Пять."
+    assert final["duration_sec"] == 5.0
+    assert rows == [
+        (1, "Раз. Два.", 0.0, 2.0),
+        (2, "Три. Четыре.", 2.0, 4.0),
+        (3, "Пять.", 4.0, 5.0),
+    ]
+
+
+def _live(monkeypatch, tmp_dir, prefix):
+    monkeypatch.setattr(settings.asr, "streaming", False)
+    monkeypatch.setattr(sessions, "TMP_DIR", tmp_dir)
+    monkeypatch.setattr(chunker.policy, "sent_min", 2)
+    monkeypatch.setattr(chunker.policy, "sent_max", 2)
+    monkeypatch.setattr(SESSION_MANAGER, "asr", FakeASR(["Раз.", "Два.", "Три."]))
+    return f"{prefix}-{uuid.uuid4().hex[:8]}"
+
+
+class SlowStore(LocalCoordinationStore):
+    async def put_handoff(self, session_id, snapshot):
+        await asyncio.sleep(0.01)  # запись в общий store не мгновенная
+        await super().put_handoff(session_id, snapshot)
+
+
+class BrokenStore(LocalCoordinationStore):
+    async def put_handoff(self, session_id, snapshot):
+        raise RuntimeError("store is down")
+
+
+def test_fast_reconnect_finds_the_snapshot(monkeypatch, tmp_dir):
+    sid = _live(monkeypatch, tmp_dir, "fast")
+
+    async def run():
+        try:
+            store = SlowStore()
+            a = SessionAffinity(store, "a", "ws://a")
+            b = SessionAffinity(store, "b", "ws://b")
+            await a.start()
+            await b.start()
+            await SESSION_MANAGER.append_audio(sid, "ru-RU", b"first")
+            await SESSION_MANAGER._process_now(sid, "ru-RU")
+            reconnects = []
+
+            def on_event(event):
+                if event["type"] == "handoff":
+                    # клиент переподключается к новому владельцу сразу по событию
+                    reconnects.append(asyncio.create_task(b.adopt(sid)))
+
+            SESSION_MANAGER.subscribe(sid, on_event)
+            assert await a.drain() == 1
+            adopted = await reconnects[0]
+            SESSION_MANAGER.unsubscribe(sid, on_event)
+            state = SESSION_MANAGER.states[sid]
+            seq = state.emitted_seq
+            await SESSION_MANAGER.close_session(sid, "ru-RU")
+            await a.stop()
+            await b.stop()
+            return adopted, seq
+        finally:
+            await async_engine.dispose()
+
+    adopted, seq = asyncio.run(run())
+    # нумерация продолжается, а не начинается с 1 поверх прежних чанков
+    assert adopted and seq == 1
+
+
+def test_failed_handoff_keeps_the_session(monkeypatch, tmp_dir):
+    sid = _live(monkeypatch, tmp_dir, "broken")
+
+    async def run():
+        try:
+            a = SessionAffinity(BrokenStore(), "a", "ws://a")
+            await a.start()
+            await SESSION_MANAGER.append_audio(sid, "ru-RU", b"first")
+            await SESSION_MANAGER._process_now(sid, "ru-RU")
+            assert await a.drain() == 0
+            assert sid in SESSION_MANAGER.states and not SESSION_MANAGER.is_detached(sid)
+            # уходящий воркер не отправляет вернувшегося клиента к тому, у кого нет снимка
+            assert await a.route(sid) is None
+            monkeypatch.setattr(SESSION_MANAGER, "asr", FakeASR(["Раз.", "Два.", "Три.", "Четыре."]))
+            await SESSION_MANAGER.append_audio(sid, "ru-RU", b"second")
+            final = await SESSION_MANAGER.close_session(sid, "ru-RU")
+            await a.stop()
+            async with get_async_session() as s:
+                rows = (await s.exec(
+                    select(ChunkModel).where(ChunkModel.session_id == sid).order_by(ChunkModel.seq)
+                )).all()
+            return final, [(r.seq, r.text) for r in rows]
+        finally:
+            await async_engine.dispose()
+
+    final, rows = asyncio.run(run())
+    assert final["text_full"] == "Раз. Два. Три. Четыре."
+    assert rows == [(1, "Раз. Два."), (2, "Три. Четыре.")]
+
+
+def test_adopt_over_limit_keeps_the_snapshot(monkeypatch):
+    monkeypatch.setattr(settings.app, "max_live_sessions", 0)
+    sid = f"limit-{uuid.uuid4().hex[:8]}"
+
+    async def run():
+        store = LocalCoordinationStore()
+        b = SessionAffinity(store, "b", "ws://b")
+        await store.put_handoff(sid, {"full_text": "Раз.", "emitted_seq": 1})
+        with pytest.raises(SessionLimitExceeded):
+            await b.adopt(sid)
+        return await store.take_handoff(sid)
+
+    assert asyncio.run(run()) == {"full_text": "Раз.", "emitted_seq": 1}
@@ -0,0 +1,93 @@
+import json
+import random
+
+import pytest
+
+from app.services.chunker import StreamingChunker, _Seg, make_chunks, policy, sentence_times, split_sentences
+
+
+def test_split_sentences_basic():
+    assert split_sentences("Привет! Это простой тест. Проверим разбиение?") == [
+        "Привет!",
+        "Это простой тест.",
+        "Проверим разбиение?",
+    ]
+
+
+def test_split_sentences_normalizes_spaces_and_keeps_tail():
+    assert split_sentences("  Первое.\n\nВторое   без точки ") == ["Первое.", "Второе без точки"]
+
+
+def test_ellipsis_before_lowercase_is_not_a_boundary():
+    assert split_sentences("Ну… я подумал. Да.") == ["Ну… я подумал.", "Да."]
+
+
+@pytest.mark.parametrize("text", [
+    "Я живу в г. Москва, на ул. Ленина.",
+    "Пушкин, т.е. А. С. Пушкин, писал стихи.",
+    "Стихи писал А. Пушкин.",
+    "Письмо А. С. Пушкину.",
+    "Сравните, напр. Казань.",
+])
+def test_abbreviations_and_initials_do_not_split(text):
+    assert split_sentences(text + " Да.") == [text, "Да."]
+
+
+@pytest.mark.parametrize("first, second", [
+    ("Мы пришли и т. д.", "Потом ушли."),
+    ("Стоит 5 тыс.", "Рублей было мало."),
+    ("Длина 10 см.", "Ширина 5 см."),
+    ("Это было в 2020 г.", "Потом всё изменилось."),
+    ("Ответ — Я.", "Потом ушли."),
+    ("Нужен план Б.", "Он готов."),
+    ("Пушкин А. С.", "Родился давно."),
+])
+def test_sentence_final_abbreviations_split(first, second):
+    assert split_sentences(f"{first} {second}") == [first, second]
+
+
+_WORDS = ["мы", "пришли", "домой", "и", "т.", "д.", "в", "2020", "г.", "А.", "С.", "Пушкин", "план", "Б.",
+          "Москва", "ул.", "Ленина", "ну…", "да", "стоит", "5", "тыс.", "рублей", "он", "сказал"]
+
+
+def _random_text(rnd):
+    sentences = []
+    for _ in range(rnd.randint(1, 25)):
+        words = [rnd.choice(_WORDS) for _ in range(rnd.randint(1, 10))]
+        words[0] = words[0][:1].upper() + words[0][1:]
+        sentences.append(" ".join(words) + rnd.choice([".", ".", "!", "?", "…", ""]))
+    return rnd.choice(["", " ", "\n"]).join(sentences) if rnd.random() < 0.2 else " ".join(sentences)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_streaming_chunker_matches_make_chunks(monkeypatch, seed):
+    monkeypatch.setattr(policy, "sent_min", 2)
+    monkeypatch.setattr(policy, "sent_max", 4)
+    monkeypatch.setattr(policy, "char_limit", 60)
+    monkeypatch.setattr(policy, "overlap_sent", 1)
+    rnd = random.Random(seed)
+    text = _random_text(rnd)
+    words = text.split()
+    # порции — по границам слов, каждая порция — один сегмент ASR
+    pieces, segments = [], []
+    i = 0
+    while i < len(words):
+        n = rnd.randint(1, 6)
+        piece = " ".join(words[i:i + n])
+        pieces.append(piece)
+        segments.append(_Seg(float(len(segments)), float(len(segments) + 1), piece))
+        i += n
+
+    chunker = StreamingChunker("eq")
+    streamed = []
+    for piece, seg in zip(pieces, segments):
+        streamed += chunker.feed(piece, [seg])
+        if rnd.random() < 0.3:
+            # передача сессии другому воркеру посреди потока
+            chunker = StreamingChunker.from_snapshot("eq", json.loads(json.dumps(chunker.snapshot())))
+    streamed += chunker.flush()
+
+    sents = split_sentences(text)
+    expected = make_chunks("eq", sents, times=sentence_times(sents, segments))
+    key = lambda ch: (ch.seq, ch.chunk_id, ch.text, ch.overlap_prefix, ch.start_sec, ch.end_sec)  # noqa: E731
+    assert [key(ch) for ch in streamed] == [key(ch) for ch in expected]
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import select
+
+from app.db import async_engine, get_async_session
+from app.delivery import outbox
+from app.delivery.outbox import OutboxDispatcher, enqueue_many
+from app.services.chunker import make_chunks, split_sentences
+from app.services.store import save_transcript
+
+
+def _sid(prefix):
+    return f"{prefix}-{uuid.uuid4().hex[:8]}"
+
+
+def _chunks(sid, n):
+    return [("chunk", {"session_id": sid, "chunk_id": f"{sid}-{i}", "seq": i, "text": "x"}, f"{sid}:{i}") for i in range(n)]
+
+
+def test_session_in_backoff_does_not_starve_others(monkeypatch):
+    monkeypatch.setattr(outbox, "BATCH", 5)
+    slow, fast = _sid("slow"), _sid("fast")
+
+    async def run():
+        try:
+            async with get_async_session() as s:
+                await enqueue_many(s, _chunks(slow, 20))
+                await enqueue_many(s, _chunks(fast, 1))
+                await s.commit()
+                conn = await s.connection()
+                await conn.execute(
+                    outbox.OutboxModel.__table__.update()
+                    .where(outbox.OutboxModel.session_id == slow)
+                    .values(next_attempt_at=datetime.utcnow() + timedelta(minutes=5))
+                )
+                await s.commit()
+            dispatcher = OutboxDispatcher()
+            started = []
+
+            async def drain(sid):
+                started.append(sid)
+                dispatcher._busy.discard(sid)
+
+            dispatcher._drain_session = drain
+            await dispatcher._dispatch_once()
+            await asyncio.sleep(0)
+            return started
+        finally:
+            await async_engine.dispose()
+
+    started = asyncio.run(run())
+    assert fast in started and slow not in started
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        if isinstance(self._body, str):
+            raise ValueError("not json")
+        return self._body
+
+
+async def _statuses(sid):
+    async with get_async_session() as s:
+        rows = (await s.exec(
+            select(outbox.OutboxModel).where(outbox.OutboxModel.session_id == sid).order_by(outbox.OutboxModel.id)
+        )).all()
+    return [(r.status, r.attempts) for r in rows]
+
+
+@pytest.mark.parametrize("body", ["OK", ["accepted"], {"results": "ok"}])
+def test_batch_2xx_without_results_object_is_delivered(monkeypatch, body):
+    sid = _sid("batch")
+
+    async def post(items):
+        return FakeResponse(200, body)
+
+    monkeypatch.setattr(outbox, "post_chunks_batch", post)
+
+    async def run():
+        try:
+            async with get_async_session() as s:
+                await enqueue_many(s, _chunks(sid, 3))
+                await s.commit()
+            dispatcher = OutboxDispatcher()
+            await dispatcher._drain_session(sid)
+            return await _statuses(sid)
+        finally:
+            await async_engine.dispose()
+
+    # повтор ответил бы тем же — пачка не должна крутиться в ретраях
+    assert asyncio.run(run()) == [("delivered", 1)] * 3
+
+
+def test_reprocess_supersedes_pending_final():
+    sid = _sid("final")
+
+    async def process(text):
+        sents = split_sentences(text)
+        chunks = make_chunks(sid, sents)
+        async with get_async_session() as s:
+            await save_transcript(s, sid, text, "ru-RU", chunks)
+            items = [("chunk", {"session_id": sid, "chunk_id": ch.chunk_id, "seq": ch.seq, "text": ch.text}, f"{sid}:{ch.chunk_id}")
+                     for ch in chunks]
+            items.append(("final", {"session_id": sid, "text_full": text}, f"{sid}:final"))
+            await enqueue_many(s, items)
+            await s.commit()
+
+    async def run():
+        try:
+            await process("Раз. Два.")
+            await process("Раз. Три.")
+            async with get_async_session() as s:
+                rows = (await s.exec(
+                    select(outbox.OutboxModel)
+                    .where(outbox.OutboxModel.session_id == sid, outbox.OutboxModel.kind == "final")
+                    .order_by(outbox.OutboxModel.id)
+                )).all()
+            return [(r.status, json.loads(r.payload_json)["text_full"]) for r in rows]
+        finally:
+            await async_engine.dispose()
+
+    assert asyncio.run(run()) == [("cancelled", "Раз. Два."), ("pending", "Раз. Три.")]
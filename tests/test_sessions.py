@@ -0,0 +1,134 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import uuid
+
+import httpx
+import pytest
+from sqlmodel import select
+
+from app.config import settings
+from app.db import async_engine, get_async_session
+from app.delivery import outbox
+from app.delivery.outbox import OutboxDispatcher
+from app.models import OutboxModel
+from app.services import chunker, sessions, webhooks
+from app.services.asr import ASRResult, ASRSegment
+from app.services.sessions import SESSION_MANAGER, SessionClosed
+from app.services.webhooks import WebhookCfg
+
+
+class FakeASR:
+    """Без streaming файл распознаётся целиком: результат — всё, что пришло на этот воркер."""
+    stub = False
+
+    def __init__(self, sentences):
+        self.sentences = sentences
+
+    def transcribe_file(self, path, mode="batch"):
+        segs = [ASRSegment(float(i), float(i + 1), s) for i, s in enumerate(self.sentences)]
+        return ASRResult(" ".join(self.sentences), segs, 1.0, float(len(segs)))
+
+
+def _live(monkeypatch, tmp_dir, prefix):
+    monkeypatch.setattr(settings.asr, "streaming", False)
+    monkeypatch.setattr(sessions, "TMP_DIR", tmp_dir)
+    monkeypatch.setattr(chunker.policy, "sent_min", 1)
+    monkeypatch.setattr(chunker.policy, "sent_max", 1)
+    return f"{prefix}-{uuid.uuid4().hex[:8]}"
+
+
+def test_webhook_5xx_moves_the_rest_of_the_session_to_outbox(monkeypatch, tmp_dir):
+    sid = _live(monkeypatch, tmp_dir, "hook")
+    hook = WebhookCfg(url="http://hook.test/chunk", secret="hook-secret")
+    statuses = [200, 503]
+    posted = []
+
+    async def post(url, content, headers, timeout=None):
+        posted.append((url, json.loads(content)["text"], headers[webhooks.HEADER_NAME], content))
+        return httpx.Response(statuses.pop(0) if statuses else 200, request=httpx.Request("POST", url))
+
+    async def active():
+        return hook
+
+    monkeypatch.setattr(webhooks, "post", post)
+    monkeypatch.setattr(sessions, "get_active_webhook", active)
+    monkeypatch.setattr(outbox, "get_active_webhook", active)
+
+    async def run():
+        try:
+            monkeypatch.setattr(SESSION_MANAGER, "asr", FakeASR(["Раз.", "Два.", "Три."]))
+            await SESSION_MANAGER.append_audio(sid, "ru-RU", b"a")
+            await SESSION_MANAGER._process_now(sid, "ru-RU")
+            # цепь снова принимает, но сессия уже в outbox — прямой отправки нет
+            monkeypatch.setattr(SESSION_MANAGER, "asr", FakeASR(["Раз.", "Два.", "Три.", "Четыре."]))
+            await SESSION_MANAGER._process_now(sid, "ru-RU")
+            direct = [text for _url, text, _sig, _body in posted]
+            async with get_async_session() as s:
+                rows = (await s.exec(
+                    select(OutboxModel).where(OutboxModel.session_id == sid).order_by(OutboxModel.id)
+                )).all()
+            queued = [(r.kind, r.seq) for r in rows]
+            posted.clear()
+            await OutboxDispatcher()._drain_session(sid)
+            SESSION_MANAGER._drop(SESSION_MANAGER.states[sid])
+            return direct, queued
+        finally:
+            await async_engine.dispose()
+
+    direct, queued = asyncio.run(run())
+    assert direct == ["Раз.", "Два."]
+    assert queued == [("webhook", 2), ("webhook", 3)]
+    # из outbox — на тот же вебхук, с его подписью и по порядку
+    assert [(url, text) for url, text, _sig, _body in posted] == [(hook.url, "Два."), (hook.url, "Три.")]
+    for _url, _text, sig, body in posted:
+        assert sig == "sha256=" + hmac.new(hook.secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def test_audio_after_close_is_rejected(monkeypatch, tmp_dir):
+    sid = _live(monkeypatch, tmp_dir, "closed")
+    monkeypatch.setattr(SESSION_MANAGER, "asr", FakeASR(["Раз."]))
+
+    async def run():
+        try:
+            await SESSION_MANAGER.append_audio(sid, "ru-RU", b"a")
+            await SESSION_MANAGER.close_session(sid, "ru-RU")
+            # состояние ещё в памяти до sweep — кадр не должен в него попасть
+            assert SESSION_MANAGER.states[sid].closed
+            with pytest.raises(SessionClosed):
+                await SESSION_MANAGER.append_audio(sid, "ru-RU", b"late")
+            SESSION_MANAGER._drop(SESSION_MANAGER.states[sid])
+            with pytest.raises(SessionClosed):
+                await SESSION_MANAGER.append_audio(sid, "ru-RU", b"late")
+        finally:
+            await async_engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_close_races_with_processing_and_itself(monkeypatch, tmp_dir):
+    sid = _live(monkeypatch, tmp_dir, "close-race")
+    monkeypatch.setattr(SESSION_MANAGER, "asr", FakeASR(["Раз.", "Два."]))
+
+    async def run():
+        try:
+            await SESSION_MANAGER.append_audio(sid, "ru-RU", b"a")
+            # цикл таймера, стартовавший прямо перед eos, и два закрытия сразу
+            late = asyncio.create_task(SESSION_MANAGER._run_processing(sid, "ru-RU"))
+            first, second = await asyncio.gather(
+                SESSION_MANAGER.close_session(sid, "ru-RU"),
+                SESSION_MANAGER.close_session(sid, "ru-RU"),
+            )
+            await late
+            # цикл, дождавшийся блокировки уже после закрытия, ничего не делает
+            await SESSION_MANAGER._process_now(sid, "ru-RU")
+            again = await SESSION_MANAGER.close_session(sid, "ru-RU")
+            SESSION_MANAGER._drop(SESSION_MANAGER.states[sid])
+            return first, second, again
+        finally:
+            await async_engine.dispose()
+
+    first, second, again = asyncio.run(run())
+    assert first == second == again
+    assert first["text_full"] == "Раз. Два." and first["total_chunks"] == 2
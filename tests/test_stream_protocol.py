@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.routers import stream
+from app.routers.stream import _PushChannel
+
+app = FastAPI()
+app.include_router(stream.router)
+
+
+class FakeWS:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+
+def _types(ws):
+    return [m["type"] for m in ws.sent]
+
+
+def test_query_protocol_2_hello():
+    with TestClient(app).websocket_connect("/v1/stream?session_id=p2q&protocol=2&ack_frames=5") as ws:
+        hello = ws.receive_json()
+        assert hello["type"] == "hello" and hello["protocol"] == 2 and hello["ack_frames"] == 5
+
+
+@pytest.mark.parametrize("requested, expected", [(1, 1), (2, 2), (99, 2), ("x", 1)])
+def test_text_hello_is_always_answered(requested, expected):
+    with TestClient(app).websocket_connect("/v1/stream?session_id=p-hello") as ws:
+        assert ws.receive_json()["protocol"] == 1
+        ws.send_text(json.dumps({"type": "hello", "protocol": requested, "ack_frames": 2000}))
+        reply = ws.receive_json()
+        assert reply["type"] == "hello" and reply["protocol"] == expected
+        if expected == 2:
+            assert reply["ack_frames"] == 1000
+
+
+def test_ack_cadence_by_frames_and_on_stop():
+    async def run():
+        ws = FakeWS()
+        push = _PushChannel(ws, "ack", ack_frames=3, ack_ms=10000, emit_partial=True)
+        push.start()
+        for _ in range(7):
+            push.frame(100)
+            await asyncio.sleep(0.01)
+        assert [m["frames"] for m in ws.sent if m["type"] == "ack"] == [3, 6]
+        await push.stop()
+        acks = [m for m in ws.sent if m["type"] == "ack"]
+        assert acks[-1]["frames"] == 7 and acks[-1]["bytes"] == 700
+
+    asyncio.run(run())
+
+
+def test_ack_by_timer():
+    async def run():
+        ws = FakeWS()
+        push = _PushChannel(ws, "ack-ms", ack_frames=100, ack_ms=50, emit_partial=True)
+        push.start()
+        push.frame(10)
+        await asyncio.sleep(0.2)
+        assert [m["frames"] for m in ws.sent if m["type"] == "ack"] == [1]
+        push.cancel()
+
+    asyncio.run(run())
+
+
+def test_slow_down_resume_hysteresis(monkeypatch):
+    load = {"value": 0.0}
+    monkeypatch.setattr(stream.ASR_EXECUTOR, "load", lambda: load["value"])
+    monkeypatch.setattr(stream.SESSION_MANAGER, "lagging", lambda _sid: False)
+    monkeypatch.setattr(settings.app, "ws_slow_down_load", 0.8)
+    monkeypatch.setattr(settings.app, "ws_resume_load", 0.5)
+
+    async def run():
+        ws = FakeWS()
+        push = _PushChannel(ws, "flow", ack_frames=10, ack_ms=1000, emit_partial=True)
+        for value in (0.7, 0.9, 0.95, 0.7, 0.6, 0.4, 0.3, 0.7):
+            load["value"] = value
+            await push._flow()
+        return _types(ws)
+
+    # между порогами состояние не меняется
+    assert asyncio.run(run()) == ["slow_down", "resume"]
+
+
+def test_sender_failure_unsubscribes():
+    class BrokenWS(FakeWS):
+        async def send_text(self, text):
+            raise RuntimeError("gone")
+
+    async def run():
+        push = _PushChannel(BrokenWS(), "broken", ack_frames=1, ack_ms=1000, emit_partial=True)
+        push.start()
+        push._on_event({"type": "chunk", "seq": 1})
+        await asyncio.sleep(0.01)
+        assert not push.alive
+        assert push._on_event not in stream.SESSION_MANAGER._listeners.get("broken", [])
+        push._on_event({"type": "chunk", "seq": 2})
+        assert push._events.empty()
+        await push.stop()
+
+    asyncio.run(run())